@@ -1,12 +1,25 @@
 import asyncio
 import logging
+import sqlite3
+from contextlib import closing
 
 import src.config.config as config
 import src.bot.mybot as bot
 import src.repository.sqlite.sqlite as sqlite
+from src.db.migrator import apply_migrations, import_legacy_photos
+from src.repository.blob.blob import BlobStore
+from src.repository.kv.backend import KeyValueRepository
 
 conf = config.Config()
-conn = sqlite.Repository(conf.db_path)
+if conf.state_backend == 'kv':
+    conn = KeyValueRepository(conf.kv_url, conf.kv_prefix, conf.kv_pool_size, conf.kv_timeout)
+    # Локальная БД остаётся только под кэши переводов, названий и советов
+    with closing(sqlite3.connect(conf.db_path, isolation_level=None)) as cache_db:
+        apply_migrations(cache_db)
+else:
+    conn = sqlite.Repository(conf.db_path, conf.db_readers, conf.db_write_batch_size)
+with closing(sqlite3.connect(conf.db_path, isolation_level=None)) as legacy_db:
+    import_legacy_photos(legacy_db, BlobStore(conf.blob_path))
 myBot = bot.MyBot(conf, conn)
 
 async def main():
@@ -1,22 +1,73 @@
+import json
+import re
+from typing import Callable, List, Optional
+
 import aiohttp
-from typing import List
+
+from src.utils.cache import AdviceCache
+from src.utils.governor import RETRY_STATUSES, governor
+
+DEFAULT_MODEL = "mistralai/mistral-7b-instruct:free"  # Бесплатная модель по умолчанию
+
+advice_cache = AdviceCache()
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def advice_key(flower: str, diseases: List[str], language: str, model: str) -> str:
+    """
+    Ключ кэша советов. Порядок болезней сохраняется — он задаёт порядок
+    разделов в ответе.
+    """
+    return json.dumps([_normalize(flower), [_normalize(d) for d in diseases], _normalize(language), model],
+                      ensure_ascii=False)
+
+
+async def get_flower_diseases_advice(
+        api_key: str,
+        diseases: List[str],
+        flower: str,
+        language: str = 'ru',
+        model: str = DEFAULT_MODEL,
+        on_chunk: Optional[Callable[[str], None]] = None
+) -> str:
+    """
+    То же, что ask_openrouter_about_flower_diseases, но через advice_cache:
+    повторные и одновременные одинаковые запросы не уходят в OpenRouter.
+    on_chunk получает частичный ответ, только если запрос действительно
+    выполняется этим вызовом; из кэша и у ожидающих приходит сразу готовый текст.
+    """
+    if not diseases:
+        raise ValueError("Список болезней не может быть пустым")
+    return await advice_cache.get_or_fetch(
+        advice_key(flower, diseases, language, model),
+        lambda: ask_openrouter_about_flower_diseases(api_key, diseases, flower, language, model, on_chunk)
+    )
+
 
 async def ask_openrouter_about_flower_diseases(
         api_key: str,
         diseases: List[str],
         flower: str,
         language: str = 'ru',
-        model: str = "mistralai/mistral-7b-instruct:free"  # Бесплатная модель по умолчанию
+        model: str = DEFAULT_MODEL,
+        on_chunk: Optional[Callable[[str], None]] = None
 ) -> str:
     """
     Запрашивает информацию о болезнях растений через OpenRouter API.
 
+    Если передан on_chunk, ответ запрашивается потоком (SSE), и on_chunk
+    вызывается с накопленным на данный момент текстом после каждого фрагмента.
+
     Args:
         api_key: Ключ API из https://openrouter.ai/keys
         diseases: Список предполагаемых болезней
         flower: Название растения
         language: Язык ответа ('ru' или другой)
         model: Модель ИИ (список доступных: https://openrouter.ai/models)
+        on_chunk: Обработчик частичного ответа для потокового режима
 
     Returns:
         Структурированный ответ с описанием болезней
@@ -63,11 +114,12 @@ async def ask_openrouter_about_flower_diseases(
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.7,
         "max_tokens": 1200,  # Рекомендуется для бесплатных моделей
+        "stream": on_chunk is not None,
     }
 
     url = "https://openrouter.ai/api/v1/chat/completions"
 
-    try:
+    async def request() -> str:
         async with aiohttp.ClientSession() as session:
             async with session.post(url, json=payload, headers=headers) as response:
                 # Обработка специфичных ошибок OpenRouter
@@ -79,14 +131,48 @@ async def ask_openrouter_about_flower_diseases(
                         "2. Используйте бесплатные модели (с :free в названии)"
                     )
 
+                if response.status in RETRY_STATUSES:
+                    # Перегрузка или сбой на стороне OpenRouter — повторит governor
+                    response.raise_for_status()
+
                 if response.status != 200:
                     error_text = await response.text()
                     raise ValueError(f"Ошибка API OpenRouter ({response.status}): {error_text}")
 
+                if on_chunk is not None:
+                    return await _read_stream(response, on_chunk)
+
                 data = await response.json()
                 return data["choices"][0]["message"]["content"].strip()
 
+    try:
+        # Генерация платная, а поток уже мог показаться пользователю: повторяем только явные отказы (429/503)
+        return await governor('openrouter').call(request, operation='stream' if on_chunk is not None else 'chat',
+                                                 idempotent=False)
     except aiohttp.ClientError as e:
         raise ConnectionError(f"Сетевая ошибка: {str(e)}")
     except KeyError:
         raise ValueError("Некорректный ответ от API. Проверьте модель и структуру запроса")
+
+
+async def _read_stream(response: aiohttp.ClientResponse, on_chunk: Callable[[str], None]) -> str:
+    """
+    Читает поток server-sent events OpenRouter. Строки-комментарии
+    (": OPENROUTER PROCESSING") пропускаются, поток заканчивается на [DONE].
+    """
+    parts = []
+    async for raw_line in response.content:
+        line = raw_line.decode('utf-8').strip()
+        if not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            break
+        event = json.loads(data)
+        if 'error' in event:
+            raise ValueError(f"Ошибка API OpenRouter: {event['error'].get('message', event['error'])}")
+        content = event["choices"][0].get("delta", {}).get("content")
+        if content:
+            parts.append(content)
+            on_chunk("".join(parts))
+    return "".join(parts).strip()
@@ -1,210 +1,381 @@
-from typing import Optional
+from typing import Optional, Any, Dict, Callable, Awaitable, List, Tuple, Union
 
-import requests
+import aiohttp
 from aiogram.utils.media_group import MediaGroupBuilder
-from deep_translator import GoogleTranslator
 
-from src.ai.request_to_openrouter import ask_openrouter_about_flower_diseases
-from src.utils.utils import get_russian_name_from_latin, format_plant_details, download_similar_images, \
-    build_similar_images_media_group, parse_plant_health_response
+from src.ai.request_to_openrouter import get_flower_diseases_advice
+from src.i18n.catalog import catalog
+from src.repository.blob.blob import BytesLike
+from src.utils.cache import TTLCache
+from src.utils.governor import CircuitOpenError, governor
+from src.utils.photo import PreparedPhoto
+from src.utils.utils import safe_translate_async, run_in_translator, get_russian_name_from_latin, \
+    format_plant_details, download_similar_images, build_similar_images_media_group, parse_plant_health_response, \
+    get_similar_image_url
 
+PLANT_ID_URL = "https://api.plant.id/v3"
+PLANT_DETAILS = 'common_names,description,taxonomy,synonyms,edible_parts,propagation_methods,watering,best_watering,best_light_condition,best_soil_type,common_uses,toxicity,cultural_significance'
 
-def handle_photo(photo_base_64: str,
+
+class PlantIdClient:
+    """
+    Асинхронный клиент Plant.id с одной долгоживущей сессией.
+
+    Сессия создаётся лениво внутри работающего event loop и держит пул
+    keep-alive соединений с кэшированием DNS. Закрывается через close().
+
+    Ответ идентификации запоминается по access_token, чтобы кнопки
+    «подробнее» и «похожие изображения» не ходили в API повторно.
+    """
+
+    def __init__(self,
                  plant_token: str,
-                 longitude: Optional[float] = None,
-                 latitude: Optional[float] = None,
-                 language: str = 'ru'
-                 ) -> tuple[str, Optional[str], Optional[str]]:
-    try:
-        data = {
-            'images': [photo_base_64],
-            "similar_images": True
-        }
+                 pool_size: int = 100,
+                 timeout: float = 60.0,
+                 connect_timeout: float = 10.0,
+                 dns_cache_ttl: int = 300,
+                 identification_cache_size: int = 1000,
+                 identification_cache_ttl: float = 3600.0,
+                 translate_timeout: float = 30.0,
+                 wikipedia_timeout: float = 10.0,
+                 image_concurrency: int = 4,
+                 image_timeout: float = 10.0,
+                 images_total_timeout: float = 20.0):
+        self.plant_token = plant_token
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.dns_cache_ttl = dns_cache_ttl
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.identifications = TTLCache(identification_cache_size, identification_cache_ttl)
+        self.translate_timeout = translate_timeout
+        self.wikipedia_timeout = wikipedia_timeout
+        self.image_concurrency = image_concurrency
+        self.image_timeout = image_timeout
+        self.images_total_timeout = images_total_timeout
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _post(self, path: str, data: Dict[str, Any], params: Optional[Dict[str, Any]] = None,
+                    photo: Optional[PreparedPhoto] = None) -> Dict[str, Any]:
+        """
+        POST в Plant.id. Если передано photo, оно дописывается в тело как
+        images: [<base64>] потоком, без сборки JSON-строки в памяти.
+        """
+        headers = {'api-key': self.plant_token}
+
+        async def request() -> Dict[str, Any]:
+            # Тело собирается заново на каждую попытку: генератор одноразовый
+            if photo is None:
+                body = {'json': data}
+            else:
+                chunks, length = photo.json_body(data)
+                body = {'data': chunks}
+                headers.update({'Content-Type': 'application/json', 'Content-Length': str(length)})
+            async with self.session.post(f"{PLANT_ID_URL}{path}", params=params, headers=headers,
+                                         **body) as response:
+                response.raise_for_status()
+                return await response.json()
 
-        if longitude is not None and latitude is not None:
-            data["latitude"] = latitude
-            data["longitude"] = longitude
+        # Идентификация и оценка здоровья платные: не повторяем запрос, который мог уже выполниться
+        return await governor('plant_id').call(request, operation=f"POST {path}", idempotent=False)
 
-        params = {
-            'language': language,
-            'details': 'common_names,description,taxonomy,synonyms,edible_parts,propagation_methods,watering,best_watering,best_light_condition,best_soil_type,common_uses,toxicity,cultural_significance'
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None,
+                   operation: Optional[str] = None) -> Dict[str, Any]:
+        """GET в Plant.id. operation — шаблон пути для метрик, если в path есть токен."""
+        headers = {'api-key': self.plant_token}
+
+        async def request() -> Dict[str, Any]:
+            async with self.session.get(f"{PLANT_ID_URL}{path}", params=params, headers=headers) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        return await governor('plant_id').call(request, operation=f"GET {operation or path}")
+
+    async def get_identification(self,
+                                 access_token: str,
+                                 params: Optional[Dict[str, Any]] = None,
+                                 language: Optional[str] = None
+                                 ) -> Dict[str, Any]:
+        """Возвращает ответ идентификации из кэша, а при промахе запрашивает его у API."""
+        cached = self.identifications.get(access_token)
+        if cached is not None:
+            cached_language, response_json = cached
+            if language is None or language == cached_language:
+                return response_json
+        response_json = await self._get(f"/identification/{access_token}", params,
+                                        operation="/identification/{access_token}")
+        self.identifications.set(access_token, (language, response_json))
+        return response_json
+
+    def compact_identification(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """
+        Урезанная копия ответа идентификации для истории: только лучшая
+        подсказка и признак растения — этого хватает для «подробнее» и
+        «похожих изображений».
+        """
+        cached = self.identifications.get(access_token)
+        if cached is None:
+            return None
+        result = cached[1].get('result', {})
+        suggestions = result.get('classification', {}).get('suggestions', [])
+        return {
+            'access_token': access_token,
+            'result': {
+                'is_plant': result.get('is_plant', {}),
+                'classification': {'suggestions': suggestions[:1]}
+            }
         }
-        headers = {'api-key': plant_token}
-        response = requests.post(
-            "https://api.plant.id/v3/identification",
-            headers=headers,
-            json=data,
-            params=params
-        )
-        response.raise_for_status()
-        response_json = response.json()
+
+    def remember_identification(self, access_token: str, language: str, response_json: Dict[str, Any]):
+        self.identifications.set(access_token, (language, response_json))
+
+    async def format_details(self, response_json: Dict[str, Any], language: str = 'ru') -> str:
         if not response_json.get("result", {}).get("is_plant", {}).get("binary", False):
-            return "Не обнаружено растение", None, None
-
-        if 'result' in response_json and 'classification' in response_json['result'] and 'suggestions' in \
-                response_json['result']['classification']:
-            suggestions = response_json['result']['classification']['suggestions']
-            if suggestions:
-                top_suggestion = suggestions[0]
-                plant_name = top_suggestion.get('name', '')
-                probability = top_suggestion.get('probability', 0)
-
-                try:
-                    probability_percent = round(float(probability) * 100)
-                    if probability_percent < 5:
-                        return "Не удалось определить растение.", None, None
-                except (ValueError, TypeError):
-                    return "Не удалось определить растение.", None, None
-
-                details = top_suggestion.get('details', {})
-                description = details.get('description', '')
-                common_names = details.get('common_names', [])
-
-                lines = [
-                    f"Вероятнее всего это: {common_names[0] if common_names else get_russian_name_from_latin(plant_name, language)}",
-                    f"Научное название: {plant_name}"
-                ]
-
-                if common_names and len(common_names) > 1:
-                    lines.append(f"Другие названия: {', '.join(common_names[1:])}")
-
-                lines.append(f"(Вероятность: {probability_percent}%)")
-
-                if description:
+            return catalog.get('not_a_plant', language)
+        return await run_in_translator(format_plant_details, response_json, language,
+                                       timeout=self.translate_timeout)
+
+    async def handle_photo(self,
+                           photo: Union[BytesLike, PreparedPhoto],
+                           longitude: Optional[float] = None,
+                           latitude: Optional[float] = None,
+                           language: str = 'ru'
+                           ) -> tuple[str, Optional[str], Optional[str]]:
+        try:
+            data = {
+                "similar_images": True
+            }
+
+            if longitude is not None and latitude is not None:
+                data["latitude"] = latitude
+                data["longitude"] = longitude
+
+            params = {
+                'language': language,
+                'details': PLANT_DETAILS
+            }
+            response_json = await self._post("/identification", data, params, PreparedPhoto.of(photo))
+            if response_json.get('access_token'):
+                self.identifications.set(response_json['access_token'], (language, response_json))
+            if not response_json.get("result", {}).get("is_plant", {}).get("binary", False):
+                return catalog.get('not_a_plant', language), None, None
+
+            if 'result' in response_json and 'classification' in response_json['result'] and 'suggestions' in \
+                    response_json['result']['classification']:
+                suggestions = response_json['result']['classification']['suggestions']
+                if suggestions:
+                    top_suggestion = suggestions[0]
+                    plant_name = top_suggestion.get('name', '')
+                    probability = top_suggestion.get('probability', 0)
+
                     try:
-                        desc_str = str(description['value']) if description is not None else ""
-                        translator = GoogleTranslator(source_lang='auto', target=language)
-                        translated_desc = translator.translate(desc_str)
-                        lines.append(f"\nОписание: {translated_desc}")
-                    except Exception as e:
-                        desc_preview = str(description)[:30] + "..." if description and len(
-                            str(description)) > 30 else str(description)
-                        text_error = f"⚠️ Ошибка перевода '{desc_preview}': {str(e)}"
-                        print(text_error)
-                        lines.append("\nОписание: Не удалось перевести описание.")
-
-                response_text = "\n".join(lines)
-                return response_text, response_json.get('access_token'), plant_name
+                        probability_percent = round(float(probability) * 100)
+                        if probability_percent < 5:
+                            return catalog.get('not_identified', language), None, None
+                    except (ValueError, TypeError):
+                        return catalog.get('not_identified', language), None, None
+
+                    details = top_suggestion.get('details', {})
+                    description = details.get('description', '')
+                    common_names = details.get('common_names', [])
+
+                    if common_names:
+                        name = common_names[0]
+                    else:
+                        name = await get_russian_name_from_latin(plant_name, language, self.session,
+                                                                 self.wikipedia_timeout)
+                    lines = [
+                        catalog.get('identified_as', language, name=name),
+                        catalog.get('scientific_name', language, name=plant_name)
+                    ]
+
+                    if common_names and len(common_names) > 1:
+                        lines.append(catalog.get('other_names', language, names=', '.join(common_names[1:])))
+
+                    lines.append(catalog.get('probability', language, percent=probability_percent))
+
+                    if description:
+                        try:
+                            desc_str = str(description['value']) if description is not None else ""
+                            translated_desc = await safe_translate_async(desc_str, target_lang=language,
+                                                                         timeout=self.translate_timeout)
+                            lines.append(catalog.get('description', language, text=translated_desc))
+                        except Exception as e:
+                            desc_preview = str(description)[:30] + "..." if description and len(
+                                str(description)) > 30 else str(description)
+                            text_error = f"⚠️ Ошибка перевода '{desc_preview}': {str(e)}"
+                            print(text_error)
+                            lines.append(catalog.get('description_failed', language))
+
+                    response_text = "\n".join(lines)
+                    return response_text, response_json.get('access_token'), plant_name
+                else:
+                    return catalog.get('not_identified', language), None, None
             else:
-                return "Не удалось определить растение.", None, None
-        else:
-            return "Не удалось получить информацию о растении.", None, None
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка запроса к Plant.id API: {e}")
-        return f"Ошибка запроса к нейронке:\n{e}", None, None
-    except Exception as e:
-        print(f"Неожиданная ошибка в handle_photo: {e}")
-        return f"Неожиданная ошибка:\n{e}", None, None
-
-
-def get_details(
-        access_token: str,
-        plant_token: str,
-        longitude: Optional[float] = None,
-        latitude: Optional[float] = None,
-        language: str = 'ru'
-) -> str:
-    try:
-        headers = {'api-key': plant_token}
-        params = {
-            'language': language,
-            'details': 'common_names,description,taxonomy,synonyms,edible_parts,propagation_methods,watering,best_watering,best_light_condition,best_soil_type,common_uses,toxicity,cultural_significance,taxonomy'
-        }
+                return catalog.get('no_plant_info', language), None, None
+        except CircuitOpenError as e:
+            print(e)
+            return e.localized(language), None, None
+        except aiohttp.ClientError as e:
+            print(f"Ошибка запроса к Plant.id API: {e}")
+            return catalog.get('request_error', language, error=e), None, None
+        except Exception as e:
+            print(f"Неожиданная ошибка в handle_photo: {e}")
+            return catalog.get('unexpected_error', language, error=e), None, None
 
-        if longitude is not None and latitude is not None:
-            params["latitude"] = latitude
-            params["longitude"] = longitude
-
-        response = requests.get(
-            f"https://api.plant.id/v3/identification/{access_token}",
-            headers=headers,
-            params=params
-        )
-        response.raise_for_status()
-        response_json = response.json()
-        if not response_json.get("result", {}).get("is_plant", {}).get("binary", False):
-            return "Не обнаружено растение"
-        return format_plant_details(response_json, language)
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка запроса к Plant.id API: {e}")
-        raise Exception(f"Ошибка запроса к нейронке:\n{e}")
-    except Exception as e:
-        print(f"Неожиданная ошибка в get_details: {e}")
-        raise Exception(f"Неожиданная ошибка:\n{e}")
-
-
-async def get_similar_images(
-        access_token: str,
-        plant_token: str
-) -> Optional[MediaGroupBuilder]:
-    try:
-        headers = {'api-key': plant_token}
-        response = requests.get(f"https://api.plant.id/v3/identification/{access_token}", headers=headers)
-        response.raise_for_status()
-        response_json = response.json()
-        if not response_json.get("result", {}).get("is_plant", {}).get("binary", False):
-            return "Не обнаружено растение"
-        if 'result' in response_json and 'classification' in response_json['result'] and 'suggestions' in \
-                response_json['result']['classification']:
-            suggestions = response_json['result']['classification']['suggestions']
-            plant_data = suggestions[0]
-            plant_name = plant_data["name"]
-
-            common_name = None
-            if "details" in plant_data and "common_names" in plant_data["details"] and plant_data["details"][
-                "common_names"]:
-                common_name = plant_data["details"]["common_names"][0]
-            similar_images = plant_data.get("similar_images", [])
-            if not similar_images:
-                raise Exception("Похожие изображения не найдены для этого растения.")
-                return None
-            downloaded_images = await download_similar_images(similar_images)
-            if not downloaded_images:
-                raise Exception("Не удалось загрузить похожие изображения, но я могу рассказать о растении.")
-                return None
-            media_group = build_similar_images_media_group(
-                downloaded_images,
-                plant_name,
-                common_name
-            )
+    async def get_details(self,
+                          access_token: str,
+                          longitude: Optional[float] = None,
+                          latitude: Optional[float] = None,
+                          language: str = 'ru'
+                          ) -> str:
+        try:
+            params = {
+                'language': language,
+                'details': PLANT_DETAILS
+            }
+
+            if longitude is not None and latitude is not None:
+                params["latitude"] = latitude
+                params["longitude"] = longitude
+
+            response_json = await self.get_identification(access_token, params, language)
+            return await self.format_details(response_json, language)
+        except CircuitOpenError as e:
+            print(e)
+            raise Exception(e.localized(language)) from e
+        except aiohttp.ClientError as e:
+            print(f"Ошибка запроса к Plant.id API: {e}")
+            raise Exception(catalog.get('request_error', language, error=e))
+        except Exception as e:
+            print(f"Неожиданная ошибка в get_details: {e}")
+            raise Exception(catalog.get('unexpected_error', language, error=e))
 
-            if not media_group:
-                raise Exception("Не удалось подготовить медиа-группу с похожими изображениями.")
+    async def get_similar_images(
+            self,
+            access_token: str,
+            language: str = 'ru',
+            lookup_file_ids: Optional[Callable[[List[str]], Awaitable[Dict[str, str]]]] = None
+    ) -> Optional[Tuple[MediaGroupBuilder, List[str]]]:
+        """
+        Собирает медиа-группу похожих изображений и список их исходных URL
+        в том же порядке. lookup_file_ids по списку URL возвращает уже
+        известные Telegram file_id — такие изображения не скачиваются.
+        """
+        try:
+            response_json = await self.get_identification(access_token)
+            if not response_json.get("result", {}).get("is_plant", {}).get("binary", False):
                 return None
-            return media_group
-    except requests.exceptions.RequestException as e:
-        print(e)
-        raise Exception(f"Ошибка запроса к нейронке:\n{e}")
-    except Exception as e:
-        print(e)
-        raise Exception(f"Неожиданная ошибка:\n{e}")
-
-
-async def health_check(
-        photo_base_64: str,
-        plant_token: str,
-        deepseek_token: str,
-        flower: str,
-        language: str = 'ru'
-) -> str:
-    try:
-        data = {
-            'images': photo_base_64
-        }
-        headers = {'api-key': plant_token}
-        response = requests.post("https://api.plant.id/v3/health_assessment", headers=headers, json=data)
-        response.raise_for_status()
-        response_json = response.json()
-        suggestions = response_json["result"]["disease"]["suggestions"]
-
-        top_3 = sorted(suggestions, key=lambda x: x["probability"], reverse=True)[:3]
-
-        top_3_names = [item["name"] for item in top_3]
-        res = await ask_openrouter_about_flower_diseases(deepseek_token, top_3_names, flower, language)
-        return parse_plant_health_response(response_json, language, res)
-    except requests.exceptions.RequestException as e:
-        print(e)
-        raise Exception(f"Ошибка запроса к нейронке:\n{e}")
-    except Exception as e:
-        print(e)
-        raise Exception(f"Неожиданная ошибка:\n{e}")
+            if 'result' in response_json and 'classification' in response_json['result'] and 'suggestions' in \
+                    response_json['result']['classification']:
+                suggestions = response_json['result']['classification']['suggestions']
+                plant_data = suggestions[0]
+                plant_name = plant_data["name"]
+
+                common_name = None
+                if "details" in plant_data and "common_names" in plant_data["details"] and plant_data["details"][
+                    "common_names"]:
+                    common_name = plant_data["details"]["common_names"][0]
+                similar_images = plant_data.get("similar_images", [])
+                if not similar_images:
+                    raise Exception(catalog.get('similar_images_not_found', language))
+                known_file_ids = {}
+                if lookup_file_ids is not None:
+                    urls = [url for url in map(get_similar_image_url, similar_images) if url]
+                    known_file_ids = await lookup_file_ids(urls)
+                downloaded_images = await download_similar_images(
+                    similar_images,
+                    self.session,
+                    known_file_ids,
+                    concurrency=self.image_concurrency,
+                    image_timeout=self.image_timeout,
+                    total_timeout=self.images_total_timeout
+                )
+                if not downloaded_images:
+                    raise Exception(catalog.get('similar_images_failed', language))
+                media_group = build_similar_images_media_group(
+                    downloaded_images,
+                    plant_name,
+                    common_name,
+                    language
+                )
+
+                if not media_group:
+                    raise Exception(catalog.get('similar_images_build_failed', language))
+                return media_group, [metadata["source_url"] for _, metadata in downloaded_images]
+        except CircuitOpenError as e:
+            print(e)
+            raise Exception(e.localized(language)) from e
+        except aiohttp.ClientError as e:
+            print(e)
+            raise Exception(catalog.get('request_error', language, error=e))
+        except Exception as e:
+            print(e)
+            raise Exception(catalog.get('unexpected_error', language, error=e))
+
+    async def assess_health(self, photo: Union[BytesLike, PreparedPhoto], language: str = 'ru') -> Dict[str, Any]:
+        """Запрос /health_assessment; от вида растения не зависит."""
+        try:
+            return await self._post("/health_assessment", {}, photo=PreparedPhoto.of(photo))
+        except CircuitOpenError as e:
+            print(e)
+            raise Exception(e.localized(language)) from e
+        except aiohttp.ClientError as e:
+            print(e)
+            raise Exception(catalog.get('request_error', language, error=e))
+        except Exception as e:
+            print(e)
+            raise Exception(catalog.get('unexpected_error', language, error=e))
+
+    async def format_health(self,
+                            response_json: Dict[str, Any],
+                            deepseek_token: str,
+                            flower: str,
+                            language: str = 'ru',
+                            on_advice_chunk: Optional[Callable[[str], None]] = None
+                            ) -> str:
+        try:
+            suggestions = response_json["result"]["disease"]["suggestions"]
+
+            top_3 = sorted(suggestions, key=lambda x: x["probability"], reverse=True)[:3]
+
+            top_3_names = [item["name"] for item in top_3]
+            res = await get_flower_diseases_advice(deepseek_token, top_3_names, flower, language,
+                                                   on_chunk=on_advice_chunk)
+            return await run_in_translator(parse_plant_health_response, response_json, language, res,
+                                           timeout=self.translate_timeout)
+        except CircuitOpenError as e:
+            print(e)
+            raise Exception(e.localized(language)) from e
+        except aiohttp.ClientError as e:
+            print(e)
+            raise Exception(catalog.get('request_error', language, error=e))
+        except Exception as e:
+            print(e)
+            raise Exception(catalog.get('unexpected_error', language, error=e))
+
+    async def health_check(self,
+                           photo: Union[BytesLike, PreparedPhoto],
+                           deepseek_token: str,
+                           flower: str,
+                           language: str = 'ru',
+                           on_advice_chunk: Optional[Callable[[str], None]] = None
+                           ) -> str:
+        response_json = await self.assess_health(photo, language)
+        return await self.format_health(response_json, deepseek_token, flower, language, on_advice_chunk)
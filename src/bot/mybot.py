@@ -1,187 +1,271 @@
-import base64
-import io
+import asyncio
+import json
+from datetime import datetime
+from typing import Optional, Dict, Set, Tuple, Callable, Awaitable, List, Union
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.types import (ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton)
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+import requests
+from aiohttp import web
+from deep_translator.exceptions import TooManyRequests, RequestError, ServerException
 
-from src.ai.request_to_plant import handle_photo, get_details, get_similar_images, health_check
+from src.ai.request_to_openrouter import advice_cache
+from src.ai.request_to_plant import PlantIdClient
+from src.bot.speculative import SpeculativeHealth
+from src.bot.streaming import ProgressiveMessage
 from src.config.config import Config
-from src.utils.utils import split_text
-from src.repository.sqlite.sqlite import Repository
+from src.i18n.catalog import catalog
+from src.utils.governor import configure_governor, governor_stats, governor_samples
+from src.utils.metrics import (registry, metrics_handler, cache_samples, Sample, HANDLER_DURATION, HANDLER_ERRORS,
+                               HANDLER_IN_FLIGHT, STAGE_DURATION)
+from src.utils.photo import select_photo_size, fit_to_budget, recompression_available, PreparedPhoto
+from src.utils.utils import split_text, translation_cache, name_cache, set_translation_workers, \
+    set_translator_timeout
+from src.repository.blob.blob import BlobStore
+from src.repository.session import SessionStore
+from src.repository.state import StateBackend
+
+Event = Union[Message, CallbackQuery]
 
 
 class MyBot:
-    def __init__(self, config: Config, conn: Repository):
-        self.main_keyboard = None
+    def __init__(self, config: Config, conn: StateBackend):
         self.plant_token = config.plant_token
         self.deepseek_token = config.deepseek_token
         self.bot = Bot(token=config.bot_token)
         self.conn = conn
+        # Общее хранилище могут менять другие процессы бота, поэтому сессии в памяти не держим
+        self.sessions = SessionStore(conn, 0 if conn.shared else config.session_cache_size, config.session_cache_ttl)
+        self.history_page_size = config.history_page_size
+        self.stream_edit_interval = config.stream_edit_interval
+        self.config = config
+        self.photo_debounce = config.photo_debounce
+        self.photo_target_side = config.photo_target_side
+        self.photo_max_bytes = config.photo_max_bytes
+        if self.photo_max_bytes > 0 and not recompression_available():
+            print("⚠️ photo_max_bytes задан, но Pillow не установлен: фото будут отправляться без пережатия")
+            self.photo_max_bytes = 0
+        self.photo_max_side = config.photo_max_side
+        self.in_flight: Set[Tuple[int, str]] = set()
+        self.photo_generations: Dict[int, int] = {}
+        self.blobs = BlobStore(config.blob_path)
+        self.plant_client = PlantIdClient(
+            config.plant_token,
+            pool_size=config.plant_pool_size,
+            timeout=config.plant_timeout,
+            connect_timeout=config.plant_connect_timeout,
+            dns_cache_ttl=config.plant_dns_cache_ttl,
+            identification_cache_size=config.identification_cache_size,
+            identification_cache_ttl=config.identification_cache_ttl,
+            translate_timeout=config.translate_timeout,
+            wikipedia_timeout=config.wikipedia_timeout,
+            image_concurrency=config.image_concurrency,
+            image_timeout=config.image_timeout,
+            images_total_timeout=config.images_total_timeout
+        )
+        self.configure_governors(config)
+        self.speculative = None
+        if config.speculative_health:
+            self.speculative = SpeculativeHealth(
+                self.plant_client,
+                config.deepseek_token,
+                conn.set_photo_health,
+                max_inflight=config.speculative_health_max_inflight,
+                daily_limit=config.speculative_health_daily_limit
+            )
+        translation_cache.maxsize = config.translation_cache_size
+        translation_cache.max_bytes = config.translation_cache_bytes
+        translation_cache.ttl = config.translation_cache_ttl
+        translation_cache.attach(config.db_path)
+        set_translation_workers(config.translate_workers)
+        set_translator_timeout(config.translator_request_timeout)
+        if config.plant_names_index:
+            name_cache.load_index(config.plant_names_index)
+        name_cache.attach(config.db_path)
+        advice_cache.ttl = config.advice_cache_ttl
+        advice_cache.maxsize = config.advice_cache_size
+        advice_cache.attach(config.db_path)
         self.dp = Dispatcher()
+        self.dp.shutdown.register(self.on_shutdown)
 
-        self.dp.message.register(self.start, CommandStart())
-
-        self.dp.message.register(self.menu_translate, F.text == 'язык')
-        self.dp.message.register(self.help, F.text == 'помощь')
-        self.dp.message.register(self.handle_location, F.location)
-        self.dp.message.register(self.geolocation, F.text == 'местоположение')
-        self.dp.message.register(self.more_details, F.text == 'подробнее')
-        self.dp.message.register(self.similar_images, F.text == "похожие изображения")
-        self.dp.message.register(self.health_check,
-                                 F.text == "оценка тяжести симптомов")
-
-        self.dp.message.register(self.menu_translate, F.text == "language")
-        self.dp.message.register(self.help, F.text == "help")
-        self.dp.message.register(self.handle_location, F.location)
-        self.dp.message.register(self.geolocation, F.text == 'location')
-        self.dp.message.register(self.more_details, F.text == 'more details')
-        self.dp.message.register(self.similar_images, F.text == "similar images")
-        self.dp.message.register(self.health_check,
-                                 F.text == "symptom severity rating")
-
-        self.dp.message.register(self.handle_photo, F.photo)
-        self.dp.callback_query.register(self.translate_ru, F.data == 'ru')
-        self.dp.callback_query.register(self.translate_en, F.data == 'en')
+        self.dp.message.register(self.timed('start', self.start), CommandStart())
+        self.dp.message.register(self.timed('history', self.history), Command('history'))
 
-    async def start(self, message: Message):
-        language = await self.conn.get_language(message.from_user.id)
-        if language == 'ru':
-            self.main_keyboard = ReplyKeyboardMarkup(
-                keyboard=[
-                    [KeyboardButton(text="местоположение", request_location=True), KeyboardButton(text="подробнее")],
-                    [KeyboardButton(text="похожие изображения"), KeyboardButton(text="оценка тяжести симптомов")],
-                    [KeyboardButton(text="помощь")],
-                    [KeyboardButton(text="язык")]
-                ],
-                resize_keyboard=True,
-                input_field_placeholder='Ваш цветок'
-            )
-        else:
-            self.main_keyboard = ReplyKeyboardMarkup(
-                keyboard=[
-                    [KeyboardButton(text="location", request_location=True), KeyboardButton(text="more details")],
-                    [KeyboardButton(text="similar images"), KeyboardButton(text="symptom severity rating")],
-                    [KeyboardButton(text="help")],
-                    [KeyboardButton(text="language")]
-                ],
-                resize_keyboard=True,
-                input_field_placeholder='Your flower'
-            )
-        await message.answer(
-            "🌱 Отправьте фото растения – я назову его и проверю на болезни.\n🌱 Send a photo of the plant - I will name it and check it for diseases.",
-            reply_markup=self.main_keyboard)
-        await self.conn.set_user_and_language(message.from_user.id)
-        await self.menu_translate(message)
+        self.dp.message.register(self.timed('menu_translate', self.menu_translate),
+                                 F.text.in_(catalog.all('button_language')))
+        self.dp.message.register(self.timed('help', self.help), F.text.in_(catalog.all('button_help')))
+        self.dp.message.register(self.timed('handle_location', self.handle_location), F.location)
+        self.dp.message.register(self.timed('geolocation', self.geolocation),
+                                 F.text.in_(catalog.all('button_location')))
+        self.dp.message.register(self.timed('more_details', self.single_flight('details', self.more_details)),
+                                 F.text.in_(catalog.all('button_more_details')))
+        self.dp.message.register(self.timed('similar_images',
+                                            self.single_flight('similar_images', self.similar_images)),
+                                 F.text.in_(catalog.all('button_similar_images')))
+        self.dp.message.register(self.timed('health_check', self.single_flight('health', self.health_check)),
+                                 F.text.in_(catalog.all('button_health')))
 
-    async def help(self, message: Message):
-        language = await self.conn.get_language(message.from_user.id)
-        if language == 'ru':
-            await message.answer(f'''📸 Как отправить фото:
+        self.dp.message.register(self.timed('handle_photo', self.handle_photo), F.photo)
+        self.dp.callback_query.register(self.timed('choose_language', self.choose_language),
+                                        F.data.in_(catalog.languages))
+        self.dp.callback_query.register(self.timed('history_page', self.history_page),
+                                        F.data.startswith('history:page:'))
+        self.dp.callback_query.register(self.timed('history_open', self.history_open),
+                                        F.data.startswith('history:open:'))
+        registry.register_collector(self.metrics_samples)
+
+    @staticmethod
+    def configure_governors(config: Config):
+        retry = dict(
+            retries=config.retry_attempts,
+            backoff=config.retry_backoff,
+            max_backoff=config.retry_max_backoff,
+            failure_threshold=config.breaker_failure_threshold,
+            reset_timeout=config.breaker_reset_timeout
+        )
+        configure_governor('plant_id', 'Plant.id', concurrency=config.plant_concurrency,
+                           timeout=config.plant_timeout, **retry)
+        configure_governor('openrouter', 'OpenRouter', concurrency=config.openrouter_concurrency,
+                           timeout=config.openrouter_timeout, **retry)
+        # Переводчик блокирующий и вызывается из потоков: срок попытки ограничивает таймаут сокета
+        configure_governor('translator', 'Google Translate', concurrency=config.translate_concurrency,
+                           timeout=config.translator_request_timeout,
+                           retry_exceptions=(TooManyRequests, RequestError, ServerException,
+                                             requests.Timeout, requests.ConnectionError), **retry)
+        configure_governor('wikipedia', 'Wikipedia', concurrency=config.wikipedia_concurrency,
+                           timeout=config.wikipedia_timeout, **retry)
+        configure_governor('images', 'Similar images', concurrency=config.images_concurrency,
+                           timeout=config.image_timeout, **retry)
 
-1) Нажми на «📎 Скрепка» (вложения)
-    
-2)Выбери «Галерея» или «Камера»
+    def single_flight(self, action: str,
+                      handler: Callable[[Message], Awaitable[None]]) -> Callable[[Message], Awaitable[None]]:
+        """
+        Не даёт одному пользователю запустить одно и то же действие дважды:
+        пока первое нажатие обрабатывается, повторные только подтверждаются.
+        """
+        async def wrapper(message: Message):
+            key = (message.from_user.id, action)
+            if key in self.in_flight:
+                session = await self.sessions.get(message.from_user.id)
+                await message.answer(catalog.get('request_in_progress', session.language))
+                return
+            self.in_flight.add(key)
+            try:
+                await handler(message)
+            finally:
+                self.in_flight.discard(key)
 
-3) Загрузи фото растения – и я его проанализирую!
+        return wrapper
 
-Если укажешь своё местоположение, результаты будут более точными!''')
-        else:
-            await message.answer(f'''📸 How to send a photo:
+    @staticmethod
+    def timed(name: str, handler: Callable[[Event], Awaitable[None]]) -> Callable[[Event], Awaitable[None]]:
+        """
+        Считает для обработчика время ответа, число выполняющихся апдейтов
+        и вылетевшие исключения (метрики bot_handler_*).
+        """
+        async def wrapper(event: Event):
+            with HANDLER_IN_FLIGHT.track_inprogress(handler=name), HANDLER_DURATION.time(handler=name):
+                try:
+                    await handler(event)
+                except Exception:
+                    HANDLER_ERRORS.inc(handler=name)
+                    raise
 
-1) Tap the "📎 Paperclip" (attachment icon)  
+        return wrapper
 
-2) Select "Gallery" or "Camera"  
+    def metrics_samples(self) -> List[Sample]:
+        """Статистика кэшей, внешних сервисов и спекулятивной оценки для /metrics."""
+        samples = governor_samples()
+        for name, cache in (('sessions', self.sessions.cache), ('identifications', self.plant_client.identifications)):
+            samples += cache_samples(name, cache.hits, cache.misses, len(cache))
+        for name, stats in (('translations', translation_cache.stats()), ('plant_names', name_cache.stats())):
+            samples += cache_samples(name, stats['hits'], stats['misses'], stats['entries'])
+        # У кэша советов промахи памяти, найденные на диске, — всё же попадания
+        stats = advice_cache.stats()
+        samples += cache_samples('advice', stats['hits'] + stats['disk_hits'], stats['misses'] - stats['disk_hits'],
+                                 stats['entries'])
+        if self.speculative:
+            for key, value in self.speculative.stats().items():
+                samples.append(('speculative_health', 'gauge', 'Спекулятивная оценка здоровья', {'stat': key}, value))
+        return samples
 
-3) Upload a photo of the plant – and I'll analyze it!
+    def get_main_keyboard(self, language: str) -> ReplyKeyboardMarkup:
+        return ReplyKeyboardMarkup(
+            keyboard=[
+                [KeyboardButton(text=catalog.get('button_location', language), request_location=True),
+                 KeyboardButton(text=catalog.get('button_more_details', language))],
+                [KeyboardButton(text=catalog.get('button_similar_images', language)),
+                 KeyboardButton(text=catalog.get('button_health', language))],
+                [KeyboardButton(text=catalog.get('button_help', language))],
+                [KeyboardButton(text=catalog.get('button_language', language))]
+            ],
+            resize_keyboard=True,
+            input_field_placeholder=catalog.get('input_placeholder', language)
+        )
 
-If you specify your location, the results will be more accurate!''')
+    async def start(self, message: Message):
+        session = await self.sessions.get(message.from_user.id)
+        language = session.language
+        await message.answer(catalog.get('start', language), reply_markup=self.get_main_keyboard(language))
+        session.language = 'ru'
+        await self.sessions.save(session)
+        await self.menu_translate(message)
+
+    async def help(self, message: Message):
+        language = (await self.sessions.get(message.from_user.id)).language
+        await message.answer(catalog.get('help', language))
 
     def get_translate_menu(self) -> InlineKeyboardMarkup:
+        # Русский первым, остальные языки каталога — следом
+        languages = sorted(catalog.languages, key=lambda lang: lang != 'ru')
         return InlineKeyboardMarkup(
             inline_keyboard=[
-                [InlineKeyboardButton(text='Русский', callback_data='ru')],
-                [InlineKeyboardButton(text='English (original)', callback_data='en')]
+                [InlineKeyboardButton(text=catalog.get('language_name', lang), callback_data=lang)]
+                for lang in languages
             ]
         )
 
     async def menu_translate(self, message: Message):
-        language = await self.conn.get_language(message.from_user.id)
-        if language == 'ru':
-            await message.answer('Выберете язык', reply_markup=self.get_translate_menu())
-        else:
-            await message.answer('Choose a language', reply_markup=self.get_translate_menu())
+        language = (await self.sessions.get(message.from_user.id)).language
+        await message.answer(catalog.get('choose_language', language), reply_markup=self.get_translate_menu())
 
-    async def translate_ru(self, callback: CallbackQuery):
-        await callback.answer('Вы выбрали язык: Русский')
+    async def choose_language(self, callback: CallbackQuery):
+        language = callback.data
+        await callback.answer(catalog.get('language_selected', language))
         await callback.message.delete()
-        await self.conn.set_user_and_language(callback.from_user.id, 'ru')
-
-        main_keyboard = ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text="местоположение", request_location=True), KeyboardButton(text="подробнее")],
-                [KeyboardButton(text="похожие изображения"), KeyboardButton(text="оценка тяжести симптомов")],
-                [KeyboardButton(text="помощь")],
-                [KeyboardButton(text="язык")]
-            ],
-            resize_keyboard=True,
-            input_field_placeholder='Ваш цветок'
-        )
+        session = await self.sessions.get(callback.from_user.id)
+        session.language = language
+        await self.sessions.save(session)
         await callback.message.answer(
-            "Язык изменён на русский.\nТеперь отправьте фото цветка.",
-            reply_markup=main_keyboard
-        )
-
-    async def translate_en(self, callback: CallbackQuery):
-        await callback.answer('You have chosen the language: English')
-        await callback.message.delete()
-        await self.conn.set_user_and_language(callback.from_user.id, 'en')
-        main_keyboard = ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text="location", request_location=True), KeyboardButton(text="more details")],
-                [KeyboardButton(text="similar images"), KeyboardButton(text="symptom severity rating")],
-                [KeyboardButton(text="help")],
-                [KeyboardButton(text="language")]
-            ],
-            resize_keyboard=True,
-            input_field_placeholder='Your flower'
-        )
-        await callback.message.answer(
-            "Language changed to English.\nNow send a photo of the flower.",
-            reply_markup=main_keyboard
+            catalog.get('language_changed', language),
+            reply_markup=self.get_main_keyboard(language)
         )
 
     async def geolocation(self, message: Message):
-        language = await self.conn.get_language(message.from_user.id)
-        if language == 'ru':
-            await message.answer('Пожалуйста, поделитесь своим местоположением:', reply_markup=self.main_keyboard)
-        else:
-            await message.answer('Please share your location:', reply_markup=self.main_keyboard)
+        language = (await self.sessions.get(message.from_user.id)).language
+        await message.answer(catalog.get('ask_location', language), reply_markup=self.get_main_keyboard(language))
 
     async def handle_location(self, message: Message):
         lat = message.location.latitude
         lon = message.location.longitude
-        user_id = message.from_user.id
-        language = await self.conn.get_language(user_id)
-        await self.conn.set_geoposition(user_id, lon, lat)
-        if language == 'ru':
-            await message.answer("Получено! Теперь ответы будут более точными")
-        else:
-            await message.answer("Now the answers will be more accurate")
+        session = await self.sessions.get(message.from_user.id)
+        session.longitude, session.latitude = lon, lat
+        await self.sessions.save(session)
+        await message.answer(catalog.get('location_saved', session.language))
 
     async def more_details(self, message: Message):
         try:
-            user_id = message.from_user.id
-            access_token = await self.conn.get_token(user_id)
-            language = await self.conn.get_language(user_id)
+            session = await self.sessions.get(message.from_user.id)
+            access_token = session.access_token
+            language = session.language
             if access_token:
-                log, lat = await self.conn.get_geoposition(user_id)
-                if language == 'ru':
-                    await message.answer("Обрабатываю запрос...")
-                else:
-                    await message.answer("Processing request...")
-                res = get_details(access_token, self.plant_token, log, lat, language)
+                log, lat = session.geoposition
+                await message.answer(catalog.get('processing_request', language))
+                res = await self.plant_client.get_details(access_token, log, lat, language)
                 parts = split_text(res)
                 print(res)
                 print(parts)
@@ -189,87 +273,351 @@ If you specify your location, the results will be more accurate!''')
                     if part.strip():
                         await message.answer(part, parse_mode="HTML")
             else:
-                if language == 'ru':
-                    await message.answer("Отправьте изображение и нажмите на кнопку повторно")
-                else:
-                    await message.answer("Send the image and click on the button again")
+                await message.answer(catalog.get('send_image_again', language))
         except Exception as e:
             print(e)
             await message.answer(str(e))
 
     async def similar_images(self, message: Message):
-        user_id = message.from_user.id
-        access_token = await self.conn.get_token(user_id)
-        language = await self.conn.get_language(user_id)
+        session = await self.sessions.get(message.from_user.id)
+        access_token = session.access_token
+        language = session.language
         if access_token:
             try:
-                similar_images = await get_similar_images(access_token, self.plant_token)
-                if similar_images:
-                    await self.bot.send_media_group(
-                        chat_id=message.chat.id,
-                        media=similar_images.build()
-                    )
-                else:
-                    if language == 'ru':
-                        await message.answer("Отправьте изображение и нажмите на кнопку повторно")
-                    else:
-                        await message.answer("Send the image and click on the button again") 
+                try:
+                    sent = await self.send_similar_images(message.chat.id, access_token, language, True)
+                except TelegramBadRequest as e:
+                    # Сохранённый file_id мог протухнуть — забываем его и загружаем заново
+                    print(f"Не удалось отправить похожие изображения по file_id: {e}")
+                    sent = await self.send_similar_images(message.chat.id, access_token, language, False)
+                if not sent:
+                    await message.answer(catalog.get('send_image_again', language))
             except Exception as e:
                 await message.answer(str(e))
         else:
-            if language == 'ru':
-                await message.answer("Отправьте изображение и нажмите на кнопку повторно")
-            else:
-                await message.answer("Send the image and click on the button again")
+            await message.answer(catalog.get('send_image_again', language))
+
+    async def send_similar_images(self, chat_id: int, access_token: str, language: str, use_file_ids: bool) -> bool:
+        lookup = self.conn.get_image_file_ids if use_file_ids else None
+        similar_images = await self.plant_client.get_similar_images(access_token, language, lookup)
+        if not similar_images:
+            return False
+        media_group, urls = similar_images
+        try:
+            messages = await self.bot.send_media_group(chat_id=chat_id, media=media_group.build())
+        except TelegramBadRequest:
+            if use_file_ids:
+                await self.conn.delete_image_file_ids(urls)
+            raise
+        file_ids = {url: sent.photo[-1].file_id for url, sent in zip(urls, messages) if sent.photo}
+        await self.conn.set_image_file_ids(file_ids)
+        return True
 
     async def health_check(self, message: Message):
-        language = await self.conn.get_language(message.from_user.id)
-        user_id = message.from_user.id
-        photo_base_64 = await self.conn.get_image_base_64(user_id)
-        if photo_base_64:
-            language = await self.conn.get_language(user_id)
-            last_flower = await self.conn.get_last_flower(user_id)
-            if last_flower:
-                res = await health_check(photo_base_64, self.plant_token, self.deepseek_token, last_flower, language)
-                await message.answer(res,
-                                     parse_mode="HTML")
+        session = await self.sessions.get(message.from_user.id)
+        language = session.language
+        access_token = session.access_token
+        if access_token:
+            cached_health = await self.conn.get_photo_health(access_token, language)
+            if not cached_health and self.speculative:
+                cached_health = await self.speculative.wait(access_token, language)
+            if cached_health:
+                await message.answer(cached_health, parse_mode="HTML")
+                return
+        photo_hash = session.image_hash
+        if photo_hash and not self.blobs.exists(photo_hash):
+            photo_hash = None
+        if not photo_hash and access_token:
+            # Фото пришло дублем и не скачивалось — загружаем его только сейчас
+            file_id = await self.conn.get_photo_file_id(access_token)
+            if file_id:
+                photo_hash = await self.ingest_photo(file_id)
+                session.image_hash = photo_hash
+                await self.sessions.save(session)
+        if photo_hash:
+            if session.last_flower:
+                progress = await ProgressiveMessage.send(message, catalog.get('processing_request', language),
+                                                         self.stream_edit_interval)
+                try:
+                    photo = PreparedPhoto(path=self.blobs.path(photo_hash))
+                    res = await self.plant_client.health_check(photo, self.deepseek_token, session.last_flower,
+                                                               language, on_advice_chunk=progress.update)
+                except Exception as e:
+                    await progress.finish(str(e), parse_mode=None)
+                    return
+                if access_token:
+                    await self.conn.set_photo_health(access_token, language, res)
+                await progress.finish(res)
             else:
-                if language == 'ru':
-                    message.answer("Отправьте фото цветка и попробуйте снова")
-                else:
-                    message.answer("Send a photo of the flower and try again")
+                await message.answer(catalog.get('send_flower_again', language))
         else:
-            if language == 'ru':
-                await message.answer("Отправьте изображение и нажмите на кнопку повторно")
-            else:
-                await message.answer("Send the image and click the button again")
+            await message.answer(catalog.get('send_image_again', language))
+
+    async def history(self, message: Message):
+        await self.send_history_page(message, message.from_user.id)
+
+    async def history_page(self, callback: CallbackQuery):
+        await callback.answer()
+        before_id = int(callback.data.rsplit(':', 1)[1])
+        await self.send_history_page(callback.message, callback.from_user.id, before_id)
+
+    async def send_history_page(self, message: Message, user_id: int, before_id: Optional[int] = None):
+        language = (await self.sessions.get(user_id)).language
+        # Берём на одну запись больше, чтобы понять, нужна ли кнопка «Дальше»
+        rows = await self.conn.get_identifications(user_id, before_id, self.history_page_size + 1)
+        if not rows:
+            await message.answer(catalog.get('history_empty', language))
+            return
+        page = rows[:self.history_page_size]
+        buttons = [
+            [InlineKeyboardButton(
+                text=catalog.get(
+                    'history_item', language,
+                    date=datetime.fromtimestamp(created_at).strftime('%d.%m.%Y %H:%M'),
+                    flower=flower,
+                    percent=round((probability or 0) * 100)
+                ),
+                callback_data=f'history:open:{identification_id}'
+            )]
+            for identification_id, flower, probability, created_at in page
+        ]
+        if len(rows) > self.history_page_size:
+            buttons.append([InlineKeyboardButton(text=catalog.get('history_next', language),
+                                                 callback_data=f'history:page:{page[-1][0]}')])
+        await message.answer(catalog.get('history_title', language),
+                             reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+
+    async def history_open(self, callback: CallbackQuery):
+        session = await self.sessions.get(callback.from_user.id)
+        language = session.language
+        identification_id = int(callback.data.rsplit(':', 1)[1])
+        row = await self.conn.get_identification(session.user_id, identification_id)
+        if not row:
+            await callback.answer(catalog.get('history_not_found', language))
+            return
+        await callback.answer()
+        access_token, flower, row_language, image_hash, result = row
+        response_json = json.loads(result)
+        # Кнопки «подробнее» и «похожие изображения» возьмут ответ из кэша, без запроса к Plant.id
+        self.plant_client.remember_identification(access_token, row_language, response_json)
+        session.access_token = access_token
+        session.last_flower = flower
+        session.image_hash = image_hash
+        await self.sessions.save(session)
+        await callback.message.answer(catalog.get('history_opened', language, flower=flower))
+        try:
+            res = await self.plant_client.format_details(response_json, language)
+            for part in split_text(res):
+                if part.strip():
+                    await callback.message.answer(part, parse_mode="HTML")
+        except Exception as e:
+            print(e)
+            await callback.message.answer(str(e))
 
     async def run(self):
-        await self.dp.start_polling(self.bot)
+        config = self.config
+        serve_separately = config.metrics_enabled and not (config.bot_mode == 'webhook' and config.metrics_on_webhook)
+        runner = await self.start_metrics_server() if serve_separately else None
+        blob_gc = asyncio.create_task(self.collect_blobs()) if config.blob_gc_interval > 0 else None
+        try:
+            if config.bot_mode == 'webhook':
+                await self.run_webhook()
+            else:
+                # После запуска в режиме webhook Telegram не отдаёт getUpdates, пока вебхук не снят
+                await self.bot.delete_webhook(drop_pending_updates=False)
+                await self.dp.start_polling(self.bot)
+        finally:
+            if blob_gc:
+                blob_gc.cancel()
+            if runner:
+                await runner.cleanup()
+
+    async def collect_blobs(self):
+        """Периодически убирает блобы, которые не использовались дольше blob_ttl."""
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.blobs.collect, self.config.blob_ttl)
+                if removed:
+                    print(f"Удалили неиспользуемые фото из хранилища блобов: {removed}")
+            except OSError as e:
+                print(f"⚠️ Ошибка при очистке хранилища блобов: {e}")
+            await asyncio.sleep(self.config.blob_gc_interval)
+
+    async def start_metrics_server(self) -> Optional[web.AppRunner]:
+        """
+        Отдельный маленький aiohttp-сервер для метрик, по умолчанию только
+        на 127.0.0.1. Если порт занят (например, второй процесс бота на том
+        же хосте), бот работает дальше без метрик.
+        """
+        config = self.config
+        app = web.Application()
+        app.router.add_get(config.metrics_path, metrics_handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, config.metrics_host, config.metrics_port).start()
+        except OSError as e:
+            await runner.cleanup()
+            print(f"⚠️ Не удалось запустить сервер метрик на {config.metrics_host}:{config.metrics_port}, "
+                  f"продолжаем без него: {e}")
+            return None
+        print(f"Метрики доступны на {config.metrics_host}:{config.metrics_port}{config.metrics_path}")
+        return runner
+
+    async def run_webhook(self):
+        """
+        Принимает обновления через встроенный aiohttp-сервер.
+
+        Telegram получает 200 сразу, само обновление обрабатывается в фоне.
+        Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются.
+        Несколько экземпляров за обратным прокси используют один секрет,
+        а вебхук регистрирует только тот, у кого webhook_register включён.
+        Метрики отдаются этим же сервером только при metrics_on_webhook,
+        иначе — отдельным сервером метрик.
+        """
+        config = self.config
+        if not config.webhook_secret:
+            raise Exception("Для режима webhook нужно задать webhook_secret")
+        app = web.Application()
+        SimpleRequestHandler(
+            dispatcher=self.dp,
+            bot=self.bot,
+            handle_in_background=True,
+            secret_token=config.webhook_secret
+        ).register(app, path=config.webhook_path)
+        if config.metrics_enabled and config.metrics_on_webhook:
+            app.router.add_get(config.metrics_path, metrics_handler)
+        setup_application(app, self.dp, bot=self.bot)
+        if config.webhook_register:
+            if not config.webhook_url:
+                raise Exception("Для регистрации вебхука нужно задать webhook_url")
+            await self.bot.set_webhook(
+                config.webhook_url.rstrip('/') + config.webhook_path,
+                secret_token=config.webhook_secret,
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, config.webhook_host, config.webhook_port).start()
+            print(f"Вебхук слушает {config.webhook_host}:{config.webhook_port}{config.webhook_path}")
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    async def on_shutdown(self):
+        if self.speculative:
+            print(f"Спекулятивная оценка здоровья: {self.speculative.stats()}")
+            await self.speculative.close()
+        await self.plant_client.close()
+        await self.conn.stop()
+        print(f"Внешние сервисы: {governor_stats()}")
+        print(f"Кэш переводов: {translation_cache.stats()}")
+        translation_cache.close()
+        name_cache.close()
+        print(f"Кэш советов: {advice_cache.stats()}")
+        advice_cache.close()
+
+    async def ingest_photo(self, file_id: str) -> str:
+        """
+        Скачивает фото сразу в хранилище блобов, не собирая его в памяти,
+        и возвращает хэш. При заданном photo_max_bytes слишком большое фото
+        пережимается в отдельном потоке и возвращается хэш пережатого блоба.
+        """
+        with STAGE_DURATION.time(stage='telegram_download'):
+            file = await self.bot.get_file(file_id)
+            with self.blobs.create() as blob:
+                await self.bot.download_file(file.file_path, blob, seek=False)
+        photo_hash = blob.blob_hash
+        if 0 < self.photo_max_bytes < blob.size:
+            with self.blobs.open(photo_hash) as photo, STAGE_DURATION.time(stage='recompress'):
+                fitted = await asyncio.to_thread(fit_to_budget, photo, self.photo_max_bytes, self.photo_max_side)
+                if fitted is not photo:
+                    # Исходный блоб не удаляем: его может читать параллельная загрузка того же фото,
+                    # а неиспользуемые блобы убирает сборка мусора хранилища
+                    photo_hash = self.blobs.put(fitted)
+        return photo_hash
 
     async def handle_photo(self, message: Message):
-        language = await self.conn.get_language(message.from_user.id)
-        print("Начата обработка изображения")
-        if language == 'ru':
-            await message.reply("Обрабатываю изображение...")
-        else:
-            await message.reply("Processing the image...")
-        photo_id = message.photo[-1].file_id
-        file = await self.bot.get_file(photo_id)
-        buffer = io.BytesIO()
-        await self.bot.download_file(file.file_path, buffer)
-        buffer.seek(0)
-        photo_bytes = buffer.getvalue()
-        photo_base_64 = base64.b64encode(photo_bytes).decode('utf-8')
+        # Из пачки фото, присланных подряд, распознаём только последнее
         user_id = message.from_user.id
-        await self.conn.set_image_base64(user_id, photo_base_64)
-        language = await self.conn.get_language(user_id)
-        position = await self.conn.get_geoposition(user_id)
-        if position:
-            lon, lat = position
-        else:
-            lon, lat = None, None
-        res, access_token, flower = handle_photo(photo_base_64, self.plant_token, lon, lat, language)
-        await self.conn.set_last_flower(user_id, flower)
-        await message.reply(res)
-        await self.conn.set_token(access_token, user_id)
+        generation = self.photo_generations.get(user_id, 0) + 1
+        self.photo_generations[user_id] = generation
+        if self.photo_debounce > 0:
+            await asyncio.sleep(self.photo_debounce)
+        if self.photo_generations.get(user_id) != generation:
+            print("Пропускаем фото: пользователь уже прислал следующее")
+            return
+        del self.photo_generations[user_id]
+
+        session = await self.sessions.get(user_id)
+        language = session.language
+        print("Начата обработка изображения")
+        await message.reply(catalog.get('processing_image', language))
+        # Берём наименьший размер, которого хватает для распознавания, а не всегда самый большой
+        photo = select_photo_size(message.photo, self.photo_target_side)
+
+        # Повторно присланное или пересланное фото узнаём ещё до скачивания
+        duplicate = await self.conn.get_photo_by_file_id(photo.file_unique_id, language)
+        if duplicate:
+            print("Фото уже распознавалось, берём результат из индекса")
+            photo_hash, res, access_token, flower = duplicate
+            session.image_hash = photo_hash if self.blobs.exists(photo_hash) else None
+            session.last_flower = flower
+            session.access_token = access_token
+            await message.reply(res)
+            await self.sessions.save(session)
+            await self.conn.copy_identification(session.user_id, access_token, *session.geoposition,
+                                                session.image_hash)
+            return
+
+        photo_hash = await self.ingest_photo(photo.file_id)
+        prepared = PreparedPhoto(path=self.blobs.path(photo_hash))
+        session.image_hash = photo_hash
+
+        duplicate = await self.conn.get_photo_by_hash(photo_hash, language)
+        if duplicate:
+            print("Фото с таким содержимым уже распознавалось, берём результат из индекса")
+            res, access_token, flower = duplicate
+            await self.conn.set_photo_file_id(photo_hash, language, photo.file_unique_id, photo.file_id)
+            session.last_flower = flower
+            session.access_token = access_token
+            await message.reply(res)
+            await self.sessions.save(session)
+            await self.conn.copy_identification(session.user_id, access_token, *session.geoposition, photo_hash)
+            return
+
+        lon, lat = session.geoposition
+        # Идентификация и оценка здоровья читают фото потоком из одного и того же блоба
+        assessment = self.speculative.start(prepared, language) if self.speculative else None
+        try:
+            res, access_token, flower = await self.plant_client.handle_photo(prepared, lon, lat, language)
+        except Exception:
+            if assessment:
+                self.speculative.discard(assessment)
+            raise
+        session.last_flower = flower
+        session.access_token = access_token
+        try:
+            await message.reply(res)
+            await self.sessions.save(session)
+            if access_token:
+                await self.conn.save_photo(photo_hash, language, photo.file_unique_id, photo.file_id,
+                                           res, access_token, flower)
+                compact = self.plant_client.compact_identification(access_token)
+                if compact:
+                    suggestions = compact['result']['classification']['suggestions']
+                    probability = suggestions[0].get('probability') if suggestions else None
+                    await self.conn.add_identification(session.user_id, access_token, flower, probability, language,
+                                                       lon, lat, photo_hash,
+                                                       json.dumps(compact, ensure_ascii=False, separators=(',', ':')))
+        except Exception:
+            if assessment:
+                self.speculative.discard(assessment)
+            raise
+        # Оценку привязываем только после save_photo: на SQLite она пишется UPDATE в строку индекса фото
+        if assessment:
+            if access_token and flower:
+                self.speculative.attach(assessment, access_token, flower, language)
+            else:
+                self.speculative.discard(assessment)
@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from src.ai.request_to_plant import PlantIdClient
+from src.utils.photo import PreparedPhoto
+
+
+class SpeculativeHealth:
+    """
+    Оценка здоровья растения, запущенная заранее, вместе с идентификацией.
+
+    start() отправляет фото в /health_assessment сразу после получения,
+    attach() по известному уже виду дописывает рекомендации и сохраняет
+    готовый ответ через save. Кнопка «оценка здоровья» ждёт задачу через
+    wait(), а не запускает проверку заново.
+
+    Расходы ограничены: одновременно выполняется не больше max_inflight
+    спекулятивных запросов, за сутки — не больше daily_limit. Если лимит
+    исчерпан, фото просто обрабатывается как обычно, по кнопке.
+    """
+
+    def __init__(self,
+                 plant_client: PlantIdClient,
+                 deepseek_token: str,
+                 save: Callable[[str, str, str], Awaitable[None]],
+                 max_inflight: int = 2,
+                 daily_limit: int = 500):
+        self.plant_client = plant_client
+        self.deepseek_token = deepseek_token
+        self.save = save
+        self.max_inflight = max_inflight
+        self.daily_limit = daily_limit
+        self._inflight = 0
+        self._day = datetime.date.today()
+        self._spent_today = 0
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.started = 0
+        self.awaited = 0
+        self.wasted = 0
+
+    def _reserve(self) -> bool:
+        today = datetime.date.today()
+        if today != self._day:
+            self._day, self._spent_today = today, 0
+        if self._inflight >= self.max_inflight or self._spent_today >= self.daily_limit:
+            return False
+        self._inflight += 1
+        self._spent_today += 1
+        self.started += 1
+        return True
+
+    def _release(self):
+        self._inflight -= 1
+
+    def start(self, photo: PreparedPhoto, language: str = 'ru') -> Optional[asyncio.Task]:
+        if not self._reserve():
+            return None
+        return asyncio.create_task(self.plant_client.assess_health(photo, language))
+
+    def discard(self, assessment: Optional[asyncio.Task]):
+        if assessment is None:
+            return
+        self._release()
+        self.wasted += 1
+        if assessment.done():
+            # Забираем исключение, чтобы asyncio не ругался на неполученную ошибку
+            if not assessment.cancelled():
+                assessment.exception()
+        else:
+            assessment.cancel()
+
+    def attach(self, assessment: Optional[asyncio.Task], access_token: str, flower: str, language: str):
+        if assessment is None:
+            return
+        key = (access_token, language)
+        if key in self._tasks:
+            self.discard(assessment)
+            return
+        task = asyncio.create_task(self._finish(assessment, access_token, flower, language))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    async def _finish(self, assessment: asyncio.Task, access_token: str, flower: str,
+                      language: str) -> Optional[str]:
+        try:
+            response_json = await assessment
+            res = await self.plant_client.format_health(response_json, self.deepseek_token, flower, language)
+        except Exception as e:
+            print(f"⚠️ Спекулятивная оценка здоровья не удалась: {e}")
+            return None
+        finally:
+            self._release()
+        try:
+            await self.save(access_token, language, res)
+        except Exception as e:
+            # Ответ уже готов: без кэша кнопка всё равно получит его через wait()
+            print(f"⚠️ Не удалось сохранить спекулятивную оценку здоровья: {e}")
+        return res
+
+    async def wait(self, access_token: str, language: str) -> Optional[str]:
+        task = self._tasks.get((access_token, language))
+        if task is None:
+            return None
+        res = await asyncio.shield(task)
+        if res is not None:
+            self.awaited += 1
+        return res
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "started": self.started,
+            "awaited": self.awaited,
+            "wasted": self.wasted,
+            "inflight": self._inflight,
+            "spent_today": self._spent_today
+        }
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from src.utils.utils import split_text
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class ProgressiveMessage:
+    """
+    Сообщение, которое дописывается по мере поступления текста.
+
+    update() только запоминает последний текст и при необходимости
+    планирует правку; правки идут не чаще одной за interval секунд,
+    промежуточные состояния схлопываются. finish() дожидается
+    запланированной правки и заменяет текст окончательным (HTML),
+    дробя его на несколько сообщений, если он не влезает в одно.
+    """
+
+    def __init__(self, message: Message, interval: float = 1.5):
+        self.message = message
+        self.interval = interval
+        self._text: Optional[str] = None
+        self._shown: Optional[str] = None
+        self._next_edit = time.monotonic() + interval
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def send(cls, message: Message, text: str, interval: float = 1.5) -> "ProgressiveMessage":
+        sent = await message.answer(text)
+        progressive = cls(sent, interval)
+        progressive._shown = text
+        return progressive
+
+    def update(self, text: str):
+        # Промежуточный текст показываем без разметки: оборванный тег сломал бы правку
+        self._text = text[:TELEGRAM_MESSAGE_LIMIT]
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        delay = self._next_edit - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        text = self._text
+        if text is None or text == self._shown:
+            return
+        await self._edit(text)
+        self._next_edit = time.monotonic() + self.interval
+
+    async def _edit(self, text: str, parse_mode: Optional[str] = None):
+        try:
+            await self.message.edit_text(text, parse_mode=parse_mode)
+            self._shown = text
+        except TelegramRetryAfter as e:
+            self._next_edit = time.monotonic() + e.retry_after
+            if parse_mode is not None:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text, parse_mode)
+        except TelegramBadRequest as e:
+            # «message is not modified» и подобное не мешают дальнейшим правкам
+            print(f"⚠️ Не удалось обновить сообщение: {e}")
+
+    async def finish(self, text: str, parse_mode: Optional[str] = "HTML"):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        delay = self._next_edit - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        first, *rest = split_text(text, TELEGRAM_MESSAGE_LIMIT)
+        await self._edit(first, parse_mode)
+        for part in rest:
+            await self.message.answer(part, parse_mode=parse_mode)
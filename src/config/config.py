@@ -1,8 +1,77 @@
+import os
+from typing import Literal, Optional
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
+PLANT_NAMES_INDEX = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'plant_names.json')
+
+
 class Config(BaseSettings):
     bot_token: str = Field()
     plant_token: str = Field()
     deepseek_token : str = Field()
-    db_path: str = Field()
\ No newline at end of file
+    db_path: str = Field()
+    blob_path: str = Field(default='photos')
+    blob_ttl: float = Field(default=30 * 24 * 3600.0)
+    blob_gc_interval: float = Field(default=6 * 3600.0)
+    plant_pool_size: int = Field(default=100)
+    plant_timeout: float = Field(default=60.0)
+    plant_connect_timeout: float = Field(default=10.0)
+    plant_dns_cache_ttl: int = Field(default=300)
+    identification_cache_size: int = Field(default=1000)
+    identification_cache_ttl: float = Field(default=3600.0)
+    translation_cache_size: int = Field(default=10000)
+    translation_cache_bytes: int = Field(default=16 * 1024 * 1024)
+    translation_cache_ttl: float = Field(default=30 * 24 * 3600.0)
+    translate_workers: int = Field(default=8)
+    translator_request_timeout: float = Field(default=10.0)
+    translate_timeout: float = Field(default=30.0)
+    wikipedia_timeout: float = Field(default=10.0)
+    image_concurrency: int = Field(default=4)
+    image_timeout: float = Field(default=10.0)
+    images_total_timeout: float = Field(default=20.0)
+    db_readers: int = Field(default=4)
+    db_write_batch_size: int = Field(default=100)
+    session_cache_size: int = Field(default=10000)
+    session_cache_ttl: float = Field(default=1800.0)
+    history_page_size: int = Field(default=5)
+    plant_names_index: str = Field(default=PLANT_NAMES_INDEX)
+    advice_cache_size: int = Field(default=1000)
+    advice_cache_ttl: float = Field(default=30 * 24 * 3600.0)
+    stream_edit_interval: float = Field(default=1.5)
+    speculative_health: bool = Field(default=False)
+    speculative_health_max_inflight: int = Field(default=2)
+    speculative_health_daily_limit: int = Field(default=500)
+    bot_mode: Literal['polling', 'webhook'] = Field(default='polling')
+    webhook_url: Optional[str] = Field(default=None)
+    webhook_path: str = Field(default='/webhook')
+    webhook_secret: Optional[str] = Field(default=None)
+    webhook_host: str = Field(default='0.0.0.0')
+    webhook_port: int = Field(default=8080)
+    webhook_register: bool = Field(default=True)
+    state_backend: Literal['sqlite', 'kv'] = Field(default='sqlite')
+    kv_url: str = Field(default='redis://localhost:6379/0')
+    kv_prefix: str = Field(default='plantbot:')
+    kv_pool_size: int = Field(default=10)
+    kv_timeout: float = Field(default=5.0)
+    photo_debounce: float = Field(default=0.7)
+    plant_concurrency: int = Field(default=20)
+    openrouter_concurrency: int = Field(default=4)
+    openrouter_timeout: float = Field(default=120.0)
+    translate_concurrency: int = Field(default=8)
+    wikipedia_concurrency: int = Field(default=8)
+    images_concurrency: int = Field(default=16)
+    retry_attempts: int = Field(default=2)
+    retry_backoff: float = Field(default=0.5)
+    retry_max_backoff: float = Field(default=10.0)
+    breaker_failure_threshold: int = Field(default=5)
+    breaker_reset_timeout: float = Field(default=30.0)
+    photo_target_side: int = Field(default=1280)
+    photo_max_bytes: int = Field(default=0)
+    photo_max_side: int = Field(default=1600)
+    metrics_enabled: bool = Field(default=True)
+    metrics_path: str = Field(default='/metrics')
+    metrics_host: str = Field(default='127.0.0.1')
+    metrics_port: int = Field(default=9464)
+    metrics_on_webhook: bool = Field(default=False)
@@ -0,0 +1,29 @@
+CREATE TABLE IF NOT EXISTS users
+(
+    id            INTEGER UNIQUE,
+    lang          TEXT,
+    access_token  TEXT,
+    image_base_64 TEXT,
+    last_flower   TEXT,
+    longitude     FLOAT,
+    latitude      FLOAT
+);
+
+CREATE TABLE IF NOT EXISTS photo_index
+(
+    photo_hash     TEXT,
+    language       TEXT,
+    file_unique_id TEXT,
+    file_id        TEXT,
+    result         TEXT,
+    access_token   TEXT,
+    last_flower    TEXT,
+    health         TEXT,
+    PRIMARY KEY (photo_hash, language)
+);
+
+CREATE TABLE IF NOT EXISTS image_file_ids
+(
+    url     TEXT PRIMARY KEY,
+    file_id TEXT
+);
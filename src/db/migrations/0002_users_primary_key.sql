@@ -0,0 +1,34 @@
+-- id становится INTEGER PRIMARY KEY (псевдоним rowid), фото хранится в блобах по image_hash
+CREATE TABLE users_new
+(
+    id           INTEGER PRIMARY KEY,
+    lang         TEXT,
+    access_token TEXT,
+    image_hash   TEXT,
+    last_flower  TEXT,
+    longitude    FLOAT,
+    latitude     FLOAT
+);
+
+INSERT INTO users_new (id, lang, access_token, last_flower, longitude, latitude)
+SELECT id, lang, access_token, last_flower, longitude, latitude
+FROM users
+WHERE id IS NOT NULL;
+
+-- Старые фото в base64 переносятся в блобы при запуске (import_legacy_photos), до этого лежат здесь
+CREATE TABLE legacy_photos
+(
+    user_id       INTEGER PRIMARY KEY,
+    image_base_64 TEXT
+);
+
+INSERT OR REPLACE INTO legacy_photos (user_id, image_base_64)
+SELECT id, image_base_64
+FROM users
+WHERE id IS NOT NULL
+  AND image_base_64 IS NOT NULL
+  AND image_base_64 != '';
+
+DROP TABLE users;
+
+ALTER TABLE users_new RENAME TO users;
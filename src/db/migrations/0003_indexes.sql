@@ -0,0 +1,14 @@
+CREATE INDEX IF NOT EXISTS photo_index_file_unique_id ON photo_index (file_unique_id, language);
+CREATE INDEX IF NOT EXISTS photo_index_access_token ON photo_index (access_token, language);
+
+CREATE TABLE IF NOT EXISTS translations
+(
+    text        TEXT,
+    source_lang TEXT,
+    target_lang TEXT,
+    translated  TEXT,
+    created_at  FLOAT,
+    PRIMARY KEY (text, source_lang, target_lang)
+);
+
+CREATE INDEX IF NOT EXISTS translations_created_at ON translations (created_at);
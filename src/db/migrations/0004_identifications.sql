@@ -0,0 +1,18 @@
+CREATE TABLE IF NOT EXISTS identifications
+(
+    id           INTEGER PRIMARY KEY,
+    user_id      INTEGER NOT NULL,
+    access_token TEXT,
+    flower       TEXT,
+    probability  FLOAT,
+    language     TEXT,
+    longitude    FLOAT,
+    latitude     FLOAT,
+    image_hash   TEXT,
+    result       TEXT,
+    created_at   FLOAT NOT NULL
+);
+
+-- Постраничный вывод истории: WHERE user_id = ? AND id < ? ORDER BY id DESC
+CREATE INDEX IF NOT EXISTS identifications_user_id ON identifications (user_id, id);
+CREATE INDEX IF NOT EXISTS identifications_access_token ON identifications (access_token);
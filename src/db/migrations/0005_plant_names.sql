@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS plant_names
+(
+    latin_name TEXT,
+    language   TEXT,
+    name       TEXT,
+    found      INTEGER,
+    created_at FLOAT,
+    PRIMARY KEY (latin_name, language)
+);
@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS advice
+(
+    key        TEXT PRIMARY KEY,
+    answer     TEXT,
+    created_at FLOAT
+);
+
+CREATE INDEX IF NOT EXISTS advice_created_at ON advice (created_at);
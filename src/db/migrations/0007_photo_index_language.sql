@@ -0,0 +1,30 @@
+-- Сессии без выбранного языка писали language = NULL: такие строки не находились по language = ?
+-- и не схлопывались по первичному ключу. Язык теперь всегда задан, NULL означает язык каталога по умолчанию
+CREATE TABLE photo_index_new
+(
+    photo_hash     TEXT,
+    language       TEXT NOT NULL,
+    file_unique_id TEXT,
+    file_id        TEXT,
+    result         TEXT,
+    access_token   TEXT,
+    last_flower    TEXT,
+    health         TEXT,
+    PRIMARY KEY (photo_hash, language)
+);
+
+-- Из дублей остаётся строка с явным языком, иначе самая свежая
+INSERT OR IGNORE INTO photo_index_new (photo_hash, language, file_unique_id, file_id, result, access_token,
+                                       last_flower, health)
+SELECT photo_hash, COALESCE(language, 'en'), file_unique_id, file_id, result, access_token, last_flower, health
+FROM photo_index
+ORDER BY language IS NULL, rowid DESC;
+
+DROP TABLE photo_index;
+
+ALTER TABLE photo_index_new RENAME TO photo_index;
+
+CREATE INDEX photo_index_file_unique_id ON photo_index (file_unique_id, language);
+CREATE INDEX photo_index_access_token ON photo_index (access_token, language);
+
+UPDATE identifications SET language = 'en' WHERE language IS NULL;
@@ -0,0 +1,74 @@
+import base64
+import binascii
+import os
+import re
+import sqlite3
+from typing import List, Tuple
+
+from src.repository.blob.blob import BlobStore
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_NAME = re.compile(r'^(\d+)_.*\.sql$')
+
+
+def list_migrations(directory: str = MIGRATIONS_DIR) -> List[Tuple[int, str]]:
+    migrations = []
+    for filename in os.listdir(directory):
+        if match := MIGRATION_NAME.match(filename):
+            migrations.append((int(match.group(1)), os.path.join(directory, filename)))
+    return sorted(migrations)
+
+
+def apply_migrations(conn: sqlite3.Connection, directory: str = MIGRATIONS_DIR) -> int:
+    """
+    Накатывает миграции с номером больше текущего PRAGMA user_version.
+
+    Каждая миграция выполняется в своей транзакции вместе с обновлением
+    user_version, поэтому при ошибке база остаётся на предыдущей версии.
+    Если база уже актуальна, не выполняется ни одного DDL-запроса.
+    Возвращает итоговую версию схемы.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, path in list_migrations(directory):
+        if number <= version:
+            continue
+        with open(path, 'r', encoding='utf-8') as script:
+            migration = script.read()
+        try:
+            conn.executescript(f"BEGIN;\n{migration}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        version = number
+        print(f"Накатили миграцию {os.path.basename(path)}")
+    return version
+
+
+def import_legacy_photos(conn: sqlite3.Connection, blobs: BlobStore) -> int:
+    """
+    Переносит фото, которые миграция 0002 сохранила из users.image_base_64
+    в legacy_photos, в хранилище блобов и проставляет users.image_hash.
+
+    Строка удаляется сразу после переноса, поэтому после сбоя следующий
+    запуск продолжает с того же места; опустевшая таблица удаляется.
+    Возвращает число перенесённых фото.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'legacy_photos'").fetchone() is None:
+        return 0
+    imported = 0
+    # По одной строке, чтобы не держать все фото в памяти
+    while row := conn.execute("SELECT user_id, image_base_64 FROM legacy_photos LIMIT 1").fetchone():
+        user_id, image_base_64 = row
+        try:
+            photo_hash = blobs.put(base64.b64decode(image_base_64, validate=True))
+        except (binascii.Error, ValueError) as e:
+            print(f"⚠️ Пропускаем битое фото пользователя {user_id}: {e}")
+        else:
+            conn.execute("UPDATE users SET image_hash = ? WHERE id = ? AND image_hash IS NULL", (photo_hash, user_id))
+            imported += 1
+        conn.execute("DELETE FROM legacy_photos WHERE user_id = ?", (user_id,))
+    conn.execute("DROP TABLE legacy_photos")
+    if imported:
+        print(f"Перенесли старые фото в хранилище блобов: {imported}")
+    return imported
@@ -0,0 +1,56 @@
+import json
+import os
+from typing import Dict, List, Any
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+
+
+class MessageCatalog:
+    """
+    Каталог статических строк интерфейса.
+
+    Каждый язык лежит в locales/<язык>.json. При загрузке недостающие ключи
+    заполняются по цепочке fallback_languages, так что get() — это одно
+    обращение к словарю. Для неизвестного языка берётся первый язык цепочки.
+    """
+
+    def __init__(self, messages: Dict[str, Dict[str, str]], fallback_languages: List[str]):
+        self.fallback_languages = [lang for lang in fallback_languages if lang in messages]
+        self._compiled: Dict[str, Dict[str, str]] = {}
+        for language in messages:
+            compiled = {}
+            for fallback in reversed([language] + self.fallback_languages):
+                compiled.update(messages[fallback])
+            self._compiled[language] = compiled
+        self._default = self._compiled[self.fallback_languages[0]] if self.fallback_languages else {}
+
+    @classmethod
+    def load(cls, directory: str = LOCALES_DIR, fallback_languages: List[str] = None) -> "MessageCatalog":
+        messages = {}
+        for filename in sorted(os.listdir(directory)):
+            language, ext = os.path.splitext(filename)
+            if ext != '.json':
+                continue
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as file:
+                messages[language] = json.load(file)
+        return cls(messages, fallback_languages or ['en', 'ru'])
+
+    @property
+    def default_language(self) -> str:
+        """Язык, которым отвечаем пользователю, ещё не выбравшему свой."""
+        return self.fallback_languages[0] if self.fallback_languages else 'ru'
+
+    @property
+    def languages(self) -> List[str]:
+        return list(self._compiled)
+
+    def get(self, key: str, language: str = 'ru', **kwargs: Any) -> str:
+        text = self._compiled.get(language, self._default)[key]
+        return text.format(**kwargs) if kwargs else text
+
+    def all(self, key: str) -> List[str]:
+        """Все варианты строки по языкам — для фильтров по тексту кнопок."""
+        return list(dict.fromkeys(messages[key] for messages in self._compiled.values()))
+
+
+catalog = MessageCatalog.load()
@@ -0,0 +1,155 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+# Временный файл старше часа — остаток прерванной записи
+TMP_MAX_AGE = 3600.0
+
+
+class BlobWriter:
+    """Файловый объект для записи нового блоба: считает sha256 по ходу записи."""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.size = 0
+        self.blob_hash: Optional[str] = None
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data: BytesLike) -> int:
+        self._sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+
+class BlobStore:
+    """
+    Контентно-адресуемое хранилище фотографий на диске.
+
+    Файл лежит по пути <root>/<первые 2 символа sha256>/<sha256>, поэтому
+    одинаковые фото хранятся один раз. Чтение идёт через mmap без
+    копирования всего файла в память процесса.
+
+    Ссылки на блобы живут в разных хранилищах состояния, поэтому блобы не
+    удаляются по ходу работы, а стареют: каждое использование обновляет
+    mtime, а collect() убирает давно не тронутые. Обработчики переживают
+    пропажу блоба и скачивают фото заново по file_id.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def hash(data: BytesLike) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, blob_hash: str) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash)
+
+    def _touch(self, path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def exists(self, blob_hash: str) -> bool:
+        """Проверка перед использованием, поэтому заодно продлевает жизнь блоба."""
+        return self._touch(self.path(blob_hash))
+
+    def put(self, data: BytesLike, blob_hash: str = None) -> str:
+        blob_hash = blob_hash or self.hash(data)
+        path = self.path(blob_hash)
+        if self._touch(path):
+            return blob_hash
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и атомарно переименовываем, чтобы читатель не увидел недописанный блоб
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            error_msg = f"Ошибка при сохранении фото {blob_hash}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+        return blob_hash
+
+    @contextmanager
+    def create(self) -> Iterator[BlobWriter]:
+        """
+        Пишет блоб потоком, не собирая его в памяти. Хэш известен только
+        в конце, поэтому данные идут во временный файл, который при выходе
+        из блока переименовывается в <hash>; хэш — в writer.blob_hash.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                writer = BlobWriter(tmp)
+                yield writer
+            blob_hash = writer.hexdigest()
+            path = self.path(blob_hash)
+            if self._touch(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            writer.blob_hash = blob_hash
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def open(self, blob_hash: str) -> Iterator[mmap.mmap]:
+        try:
+            with open(self.path(blob_hash), 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            error_msg = f"Ошибка при чтении фото {blob_hash}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+        try:
+            yield data
+        finally:
+            data.close()
+
+    def delete(self, blob_hash: str):
+        try:
+            os.remove(self.path(blob_hash))
+        except FileNotFoundError:
+            pass
+
+    def collect(self, max_age: float) -> int:
+        """
+        Удаляет блобы, которые не использовались дольше max_age секунд,
+        и брошенные временные файлы. Возвращает число удалённых блобов.
+        """
+        now = time.time()
+        removed = 0
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                is_tmp = filename.endswith('.tmp')
+                try:
+                    if now - os.stat(path).st_mtime <= (TMP_MAX_AGE if is_tmp else max_age):
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                if not is_tmp:
+                    removed += 1
+        return removed
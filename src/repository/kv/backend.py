@@ -0,0 +1,243 @@
+import asyncio
+import json
+import time
+from typing import Optional, Tuple, List, Dict, Any
+
+from src.repository.kv.client import KVClient, KVError
+from src.repository.session import UserSession
+from src.repository.state import StateBackend
+
+KV_ERRORS = (KVError, ConnectionError, OSError, asyncio.TimeoutError, ValueError)
+
+
+class KeyValueRepository(StateBackend):
+    """
+    Состояние бота в сетевом хранилище ключ-значение с протоколом Redis.
+
+    Все процессы бота, подключённые к одному серверу, видят одни и те же
+    сессии, индекс фото и кэши file_id. Значения хранятся в JSON под
+    ключами с общим префиксом:
+
+        user:{id}                      сессия пользователя
+        photo:{hash}:{lang}            результат распознавания фото
+        photo_file:{file_unique_id}:{lang} → hash
+        token_file:{access_token}      file_id фото для токена
+        health:{access_token}:{lang}   оценка здоровья
+        image:{url}                    file_id похожего изображения
+        history_seq:{user_id}          счётчик записей истории
+        history:{user_id}:{id}         запись истории
+        history_token:{access_token}   последняя запись истории с этим токеном
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = 'plantbot:', pool_size: int = 10, timeout: float = 5.0):
+        self.prefix = prefix
+        self.client = KVClient(url, pool_size, timeout)
+
+    def _key(self, *parts: Any) -> str:
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    @staticmethod
+    def _dump(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def _load(data: Optional[bytes]) -> Any:
+        return json.loads(data) if data is not None else None
+
+    async def get_user_session(self, user_id: int) -> UserSession:
+        try:
+            res = self._load(await self.client.get(self._key('user', user_id)))
+            if not res:
+                return UserSession(user_id)
+            return UserSession(user_id, *res)
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось получить сессию пользователя {user_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def save_user_session(self, session: UserSession):
+        try:
+            await self.client.set(self._key('user', session.user_id), self._dump([
+                session.language, session.access_token, session.image_hash,
+                session.last_flower, session.longitude, session.latitude
+            ]))
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось сохранить сессию пользователя {session.user_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_photo_by_file_id(self, file_unique_id: str, language: str) -> Optional[Tuple[str, str, str, str]]:
+        try:
+            photo_hash = await self.client.get(self._key('photo_file', file_unique_id, language))
+            if photo_hash is None:
+                return None
+            photo_hash = photo_hash.decode('utf-8')
+            photo = self._load(await self.client.get(self._key('photo', photo_hash, language)))
+            return (photo_hash, photo['result'], photo['access_token'], photo['flower']) if photo else None
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось найти фото по file_unique_id {file_unique_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_photo_by_hash(self, photo_hash: str, language: str) -> Optional[Tuple[str, str, str]]:
+        try:
+            photo = self._load(await self.client.get(self._key('photo', photo_hash, language)))
+            return (photo['result'], photo['access_token'], photo['flower']) if photo else None
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось найти фото по хэшу {photo_hash}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def save_photo(self, photo_hash: str, language: str, file_unique_id: str, file_id: str,
+                         result: str, access_token: str, flower: str):
+        try:
+            await self.client.pipeline([
+                ("SET", self._key('photo', photo_hash, language), self._dump({
+                    'file_unique_id': file_unique_id,
+                    'file_id': file_id,
+                    'result': result,
+                    'access_token': access_token,
+                    'flower': flower
+                })),
+                ("SET", self._key('photo_file', file_unique_id, language), photo_hash),
+                ("SET", self._key('token_file', access_token), file_id)
+            ])
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось сохранить фото {photo_hash}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def set_photo_file_id(self, photo_hash: str, language: str, file_unique_id: str, file_id: str):
+        try:
+            photo = self._load(await self.client.get(self._key('photo', photo_hash, language)))
+            if not photo:
+                return
+            photo['file_unique_id'] = file_unique_id
+            photo['file_id'] = file_id
+            await self.client.pipeline([
+                ("SET", self._key('photo', photo_hash, language), self._dump(photo)),
+                ("SET", self._key('photo_file', file_unique_id, language), photo_hash),
+                ("SET", self._key('token_file', photo['access_token']), file_id)
+            ])
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось обновить file_id для фото {photo_hash}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_photo_file_id(self, access_token: str) -> Optional[str]:
+        try:
+            file_id = await self.client.get(self._key('token_file', access_token))
+            return file_id.decode('utf-8') if file_id is not None else None
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось получить file_id для токена {access_token}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_photo_health(self, access_token: str, language: str) -> Optional[str]:
+        try:
+            health = await self.client.get(self._key('health', access_token, language))
+            return health.decode('utf-8') if health is not None else None
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось получить оценку здоровья для токена {access_token}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def set_photo_health(self, access_token: str, language: str, health: str):
+        try:
+            await self.client.set(self._key('health', access_token, language), health)
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось сохранить оценку здоровья для токена {access_token}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_image_file_ids(self, urls: List[str]) -> Dict[str, str]:
+        if not urls:
+            return {}
+        try:
+            values = await self.client.mget([self._key('image', url) for url in urls])
+            return {url: file_id.decode('utf-8') for url, file_id in zip(urls, values) if file_id is not None}
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось получить file_id изображений: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def set_image_file_ids(self, file_ids: Dict[str, str]):
+        try:
+            await self.client.pipeline([("SET", self._key('image', url), file_id) for url, file_id in file_ids.items()])
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось сохранить file_id изображений: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def delete_image_file_ids(self, urls: List[str]):
+        try:
+            await self.client.delete(*[self._key('image', url) for url in urls])
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось удалить file_id изображений: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def _append_history(self, user_id: int, entry: List[Any]):
+        identification_id = await self.client.incr(self._key('history_seq', user_id))
+        await self.client.pipeline([
+            ("SET", self._key('history', user_id, identification_id), self._dump(entry)),
+            ("SET", self._key('history_token', entry[0]), self._dump(entry))
+        ])
+
+    async def add_identification(self, user_id: int, access_token: str, flower: str, probability: float,
+                                 language: str, longitude: Optional[float], latitude: Optional[float],
+                                 image_hash: Optional[str], result: str):
+        try:
+            await self._append_history(user_id, [access_token, flower, probability, language, longitude, latitude,
+                                                 image_hash, result, time.time()])
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось сохранить историю для пользователя {user_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def copy_identification(self, user_id: int, access_token: str, longitude: Optional[float],
+                                  latitude: Optional[float], image_hash: Optional[str]):
+        """Добавляет в историю пользователя уже известное распознавание (повторное фото)."""
+        try:
+            entry = self._load(await self.client.get(self._key('history_token', access_token)))
+            if not entry:
+                return
+            entry[4], entry[5] = longitude, latitude
+            entry[6] = image_hash or entry[6]
+            entry[8] = time.time()
+            await self._append_history(user_id, entry)
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось сохранить историю для пользователя {user_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_identifications(self, user_id: int, before_id: Optional[int] = None,
+                                  limit: int = 5) -> List[Tuple[int, str, float, float]]:
+        try:
+            if before_id is None:
+                last_id = await self.client.get(self._key('history_seq', user_id))
+                before_id = int(last_id) + 1 if last_id is not None else 1
+            # Номера записей у пользователя идут подряд, поэтому страница — это просто диапазон ключей
+            ids = list(range(before_id - 1, max(before_id - 1 - limit, 0), -1))
+            entries = await self.client.mget([self._key('history', user_id, i) for i in ids])
+            return [(i, entry[1], entry[2], entry[8])
+                    for i, entry in zip(ids, map(self._load, entries)) if entry]
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось получить историю пользователя {user_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_identification(self, user_id: int,
+                                 identification_id: int) -> Optional[Tuple[str, str, str, Optional[str], str]]:
+        try:
+            entry = self._load(await self.client.get(self._key('history', user_id, identification_id)))
+            return (entry[0], entry[1], entry[3], entry[6], entry[7]) if entry else None
+        except KV_ERRORS as e:
+            error_msg = f"Ошибка при запросе к хранилищу: не удалось получить запись истории {identification_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def stop(self):
+        await self.client.close()
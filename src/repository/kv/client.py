@@ -0,0 +1,169 @@
+import asyncio
+from typing import Any, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from src.utils.metrics import STORAGE_DURATION, STORAGE_ERRORS
+
+
+class KVError(Exception):
+    """Ошибка, которую вернул сервер ключ-значение."""
+
+
+def encode_command(*args: Any) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode('utf-8')
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Сервер закрыл соединение")
+    kind, body = line[:1], line[1:-2]
+    if kind == b'+':
+        return body.decode('utf-8')
+    if kind == b'-':
+        return KVError(body.decode('utf-8'))
+    if kind == b':':
+        return int(body)
+    if kind == b'$':
+        length = int(body)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b'*':
+        length = int(body)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise KVError(f"Непонятный ответ сервера: {line!r}")
+
+
+class KVClient:
+    """
+    Минимальный асинхронный клиент для серверов с протоколом Redis (RESP).
+
+    Держит пул из pool_size соединений. pipeline() отправляет несколько
+    команд одной записью в сокет и читает ответы подряд, так что групповые
+    операции стоят одного сетевого круга. Соединение, на котором случилась
+    сетевая ошибка или таймаут, выбрасывается из пула.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", pool_size: int = 10, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # None в очереди — свободное место под ещё не открытое соединение
+        self._pool: asyncio.Queue = asyncio.Queue()
+        for _ in range(pool_size):
+            self._pool.put_nowait(None)
+        self._connections: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def _open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = (reader, writer)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in await self._exchange(connection, setup):
+                if isinstance(reply, KVError):
+                    writer.close()
+                    raise reply
+        return connection
+
+    @staticmethod
+    async def _exchange(connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter],
+                        commands: Sequence[Sequence[Any]]) -> List[Any]:
+        reader, writer = connection
+        writer.write(b"".join(encode_command(*command) for command in commands))
+        await writer.drain()
+        return [await read_reply(reader) for _ in commands]
+
+    async def _acquire(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        connection = await self._pool.get()
+        if connection is not None:
+            return connection
+        try:
+            connection = await asyncio.wait_for(self._open(), self.timeout)
+        except BaseException:
+            self._pool.put_nowait(None)
+            raise
+        self._connections.append(connection)
+        return connection
+
+    def _discard(self, connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+        connection[1].close()
+        if connection in self._connections:
+            self._connections.remove(connection)
+        self._pool.put_nowait(None)
+
+    async def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        if not commands:
+            return []
+        with STORAGE_DURATION.time(backend='kv', kind='pipeline'):
+            connection = await self._acquire()
+            try:
+                replies = await asyncio.wait_for(self._exchange(connection, commands), self.timeout)
+            except BaseException as e:
+                # Ответы могли остаться непрочитанными — такое соединение больше не годится
+                self._discard(connection)
+                if isinstance(e, Exception):
+                    STORAGE_ERRORS.inc(backend='kv', kind='pipeline')
+                raise
+        self._pool.put_nowait(connection)
+        for reply in replies:
+            if isinstance(reply, KVError):
+                raise reply
+        return replies
+
+    async def execute(self, *args: Any) -> Any:
+        return (await self.pipeline([args]))[0]
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.execute("GET", key)
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self.execute("MGET", *keys)
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        if ttl:
+            await self.execute("SET", key, value, "EX", ttl)
+        else:
+            await self.execute("SET", key, value)
+
+    async def delete(self, *keys: str) -> int:
+        if not keys:
+            return 0
+        return await self.execute("DEL", *keys)
+
+    async def incr(self, key: str) -> int:
+        return await self.execute("INCR", key)
+
+    async def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait()
+        for _ in range(self.pool_size):
+            self._pool.put_nowait(None)
+        for _, writer in self._connections:
+            writer.close()
+        for _, writer in self._connections:
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self._connections.clear()
@@ -0,0 +1,114 @@
+"""
+Локальная замена сервера Redis для разработки и проверки нескольких
+процессов бота без настоящего Redis. Понимает только команды, которыми
+пользуется KeyValueRepository, и хранит всё в памяти.
+
+    python -m src.repository.kv.standin --port 6379
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.repository.kv.client import KVError
+
+
+def encode_reply(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, KVError):
+        return b"-%s\r\n" % str(value).encode('utf-8')
+    if isinstance(value, bool):
+        return b"+OK\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+class StandInServer:
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def handle(self, args: List[bytes]) -> Any:
+        command, args = args[0].upper(), args[1:]
+        if command == b'PING':
+            return b"PONG"
+        if command in (b'AUTH', b'SELECT'):
+            return True
+        if command == b'GET':
+            return self._get(args[0])
+        if command == b'MGET':
+            return [self._get(key) for key in args]
+        if command == b'SET':
+            expires_at = None
+            if len(args) == 4 and args[2].upper() == b'EX':
+                expires_at = time.monotonic() + int(args[3])
+            self.data[args[0]] = (args[1], expires_at)
+            return True
+        if command == b'DEL':
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if command == b'INCR':
+            value = int(self._get(args[0]) or 0) + 1
+            self.data[args[0]] = (str(value).encode(), None)
+            return value
+        if command == b'FLUSHDB':
+            self.data.clear()
+            return True
+        return KVError(f"ERR unknown command '{command.decode()}'")
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (args := await read_command(reader)) is not None:
+                if args:
+                    writer.write(encode_reply(self.handle(args)))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 6379) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.serve_client, host, port)
+
+
+async def main(host: str, port: int):
+    server = await StandInServer().start(host, port)
+    print(f"Хранилище-заглушка слушает {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Хранилище ключ-значение в памяти с протоколом Redis")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    options = parser.parse_args()
+    try:
+        asyncio.run(main(options.host, options.port))
+    except KeyboardInterrupt:
+        pass
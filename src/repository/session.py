@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from src.i18n.catalog import catalog
+from src.utils.cache import TTLCache
+
+
+@dataclass
+class UserSession:
+    """Всё, что бот помнит о пользователе, — одна строка таблицы users."""
+    user_id: int
+    language: Optional[str] = None
+    access_token: Optional[str] = None
+    image_hash: Optional[str] = None
+    last_flower: Optional[str] = None
+    longitude: Optional[float] = None
+    latitude: Optional[float] = None
+
+    @property
+    def geoposition(self) -> Tuple[Optional[float], Optional[float]]:
+        if self.longitude is not None and self.latitude is not None:
+            return self.longitude, self.latitude
+        return None, None
+
+
+class SessionStore:
+    """
+    Сессии пользователей с ограниченным кэшем в памяти.
+
+    get() читает строку одним запросом только при промахе кэша,
+    save() обновляет кэш и сразу пишет всю строку одним UPSERT.
+    Пользователю без выбранного языка сразу подставляется язык каталога
+    по умолчанию: с ним же ищутся и сохраняются фото в индексе.
+    """
+
+    def __init__(self, repository, maxsize: int = 10000, ttl: float = 1800.0):
+        self.repository = repository
+        self.cache = TTLCache(maxsize, ttl)
+
+    async def get(self, user_id: int) -> UserSession:
+        session = self.cache.get(user_id)
+        if session is None:
+            session = await self.repository.get_user_session(user_id)
+            session.language = session.language or catalog.default_language
+            self.cache.set(user_id, session)
+        return session
+
+    async def save(self, session: UserSession):
+        self.cache.set(session.user_id, session)
+        await self.repository.save_user_session(session)
@@ -1,19 +1,57 @@
+import asyncio
 import sqlite3
-from typing import Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, List, Dict, Any
 
+from src.db.migrator import apply_migrations
+from src.repository.session import UserSession
+from src.repository.state import StateBackend
+from src.utils.metrics import STORAGE_DURATION, STORAGE_ERRORS
 
-class Repository:
-    def __init__(self, db_path: str):
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    # В режиме WAL NORMAL не делает fsync на каждый коммит, только на чекпоинтах
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA foreign_keys = ON",
+)
+
+
+class Repository(StateBackend):
+    """
+    Асинхронный репозиторий поверх SQLite в режиме WAL.
+
+    Чтения выполняются в небольшом пуле потоков, у каждого потока своё
+    соединение. Все записи идут через одну задачу-писателя: она забирает
+    из очереди всё накопившееся (до write_batch_size запросов) и фиксирует
+    пачку одним коммитом. Каждый запрос в пачке обёрнут в SAVEPOINT, так что
+    ошибка одного не откатывает остальные.
+
+    Время чтений, записей (вместе с ожиданием своей пачки) и коммитов
+    пишется в storage_call_duration_seconds.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4, write_batch_size: int = 100):
+        self.db_path = db_path
+        self.write_batch_size = write_batch_size
         self.conn: Optional[sqlite3.Connection] = None
         self.cursor: Optional[sqlite3.Cursor] = None
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._local = threading.local()
+        self._reader_conns: List[sqlite3.Connection] = []
+        self._reader_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
         try:
-            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn = self._connect()
             self.cursor = self.conn.cursor()
-            with open('src/db/migrations/init.sql', 'r', encoding='utf-8') as script:
-                migration = script.read()
-            self.cursor.executescript(migration)
-            self.conn.commit()
-            print("Миграцию накатили")
+            version = apply_migrations(self.conn)
+            print(f"Версия схемы БД: {version}")
         except sqlite3.Error as e:
             error_msg = f"Ошибка при инициализации базы данных: {e}"
             print(error_msg)
@@ -25,139 +63,329 @@ class Repository:
             self.close()
             raise Exception(error_msg) from e
 
-    async def set_user_and_language(self, user_id: int, language: str = 'ru'):
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: транзакциями писателя управляем сами через BEGIN/COMMIT
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _reader_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._reader_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    async def _read(self, sql: str, params: Any = (), fetch_all: bool = False) -> Any:
+        def run():
+            cursor = self._reader_connection().execute(sql, params)
+            return cursor.fetchall() if fetch_all else cursor.fetchone()
+
+        with STORAGE_DURATION.time(backend='sqlite', kind='read'):
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._readers, run)
+            except sqlite3.Error:
+                STORAGE_ERRORS.inc(backend='sqlite', kind='read')
+                raise
+
+    async def _write(self, sql: str, params: Any = (), many: bool = False):
+        if self._writer_task is None or self._writer_task.done():
+            self._queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+        future = asyncio.get_running_loop().create_future()
+        with STORAGE_DURATION.time(backend='sqlite', kind='write'):
+            await self._queue.put((sql, params, many, future))
+            try:
+                await future
+            except sqlite3.Error:
+                STORAGE_ERRORS.inc(backend='sqlite', kind='write')
+                raise
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.write_batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            with STORAGE_DURATION.time(backend='sqlite', kind='commit'):
+                errors = await loop.run_in_executor(self._writer, self._commit_batch, batch)
+            for (_, _, _, future), error in zip(batch, errors):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+
+    def _commit_batch(self, batch: List[Tuple[str, Any, bool, asyncio.Future]]) -> List[Optional[sqlite3.Error]]:
+        errors: List[Optional[sqlite3.Error]] = []
         try:
-            self.cursor.execute("""
-                INSERT INTO users (id, lang)
-                VALUES (?, ?)
-                ON CONFLICT(id) DO UPDATE SET lang = excluded.lang
-            """, (user_id, language))
-            self.conn.commit()
+            self.conn.execute("BEGIN")
+            for sql, params, many, _ in batch:
+                try:
+                    self.conn.execute("SAVEPOINT write")
+                    if many:
+                        self.conn.executemany(sql, params)
+                    else:
+                        self.conn.execute(sql, params)
+                    self.conn.execute("RELEASE write")
+                    errors.append(None)
+                except sqlite3.Error as e:
+                    self.conn.execute("ROLLBACK TO write")
+                    self.conn.execute("RELEASE write")
+                    errors.append(e)
+            self.conn.execute("COMMIT")
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при запросе к СУБД: не удалось установить язык для пользователя {user_id}: {e}"
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            return [e] * len(batch)
+        return errors
+
+    async def stop(self):
+        """Дожидается записи всего, что уже стоит в очереди, и останавливает писателя."""
+        if self._writer_task is not None and not self._writer_task.done():
+            await self._queue.put(None)
+            await self._writer_task
+        self._writer_task = None
+
+    async def get_user_session(self, user_id: int) -> UserSession:
+        try:
+            res = await self._read("""
+                SELECT lang, access_token, image_hash, last_flower, longitude, latitude
+                FROM users
+                WHERE id = ?
+            """, (user_id,))
+            if not res:
+                return UserSession(user_id)
+            return UserSession(user_id, *res)
+        except sqlite3.Error as e:
+            error_msg = f"Ошибка при запросе к СУБД: не удалось получить сессию пользователя {user_id}: {e}"
             print(error_msg)
-            self.conn.rollback()
             raise Exception(error_msg) from e
 
-    async def get_token(self, user_id: int) -> Optional[str]:
+    async def save_user_session(self, session: UserSession):
         try:
-            self.cursor.execute("SELECT access_token FROM users WHERE id = ?", (user_id,))
-            res = self.cursor.fetchone()
-            return str(res[0]) if res and res[0] is not None else None
+            await self._write("""
+                INSERT INTO users (id, lang, access_token, image_hash, last_flower, longitude, latitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    lang = excluded.lang,
+                    access_token = excluded.access_token,
+                    image_hash = excluded.image_hash,
+                    last_flower = excluded.last_flower,
+                    longitude = excluded.longitude,
+                    latitude = excluded.latitude
+            """, (session.user_id, session.language, session.access_token, session.image_hash,
+                  session.last_flower, session.longitude, session.latitude))
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при запросе к СУБД: не удалось получить токен для пользователя {user_id}: {e}"
+            error_msg = f"Ошибка при запросе к СУБД: не удалось сохранить сессию пользователя {session.user_id}: {e}"
             print(error_msg)
             raise Exception(error_msg) from e
 
-    async def get_language(self, user_id: int) -> Optional[str]:
+    async def get_photo_by_file_id(self, file_unique_id: str, language: str) -> Optional[Tuple[str, str, str, str]]:
         try:
-            self.cursor.execute("SELECT lang FROM users WHERE id = ?", (user_id,))
-            res = self.cursor.fetchone()
-            return res[0] if res and res[0] is not None else None
+            res = await self._read("""
+                SELECT photo_hash, result, access_token, last_flower
+                FROM photo_index
+                WHERE file_unique_id = ? AND language = ?
+            """, (file_unique_id, language))
+            return (res[0], res[1], res[2], res[3]) if res else None
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при запросе к СУБД: не удалось получить язык для пользователя {user_id}: {e}"
+            error_msg = f"Ошибка при запросе к СУБД: не удалось найти фото по file_unique_id {file_unique_id}: {e}"
             print(error_msg)
             raise Exception(error_msg) from e
 
-    async def set_token(self, access_token: str, user_id: int):
+    async def get_photo_by_hash(self, photo_hash: str, language: str) -> Optional[Tuple[str, str, str]]:
         try:
-            self.cursor.execute("""
-                UPDATE users
-                SET access_token = ?
-                WHERE id = ?
-            """, (access_token, user_id))
-            self.conn.commit()
+            res = await self._read("""
+                SELECT result, access_token, last_flower
+                FROM photo_index
+                WHERE photo_hash = ? AND language = ?
+            """, (photo_hash, language))
+            return (res[0], res[1], res[2]) if res else None
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при запросе к СУБД: не удалось установить токен для пользователя {user_id}: {e}"
+            error_msg = f"Ошибка при запросе к СУБД: не удалось найти фото по хэшу {photo_hash}: {e}"
             print(error_msg)
-            self.conn.rollback()
             raise Exception(error_msg) from e
 
-    async def set_image_base64(self, user_id: int, image_base64: str):
+    async def save_photo(self, photo_hash: str, language: str, file_unique_id: str, file_id: str,
+                         result: str, access_token: str, flower: str):
         try:
-            self.cursor.execute("""
-                INSERT INTO users (id, lang, access_token, image_base_64)
-                VALUES (?, 'ru', NULL, ?)
-                ON CONFLICT(id) DO UPDATE SET
-                    image_base_64 = excluded.image_base_64
-            """, (user_id, image_base64))
-            self.conn.commit()
+            await self._write("""
+                INSERT INTO photo_index (photo_hash, language, file_unique_id, file_id, result, access_token, last_flower)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(photo_hash, language) DO UPDATE SET
+                    file_unique_id = excluded.file_unique_id,
+                    file_id = excluded.file_id,
+                    result = excluded.result,
+                    access_token = excluded.access_token,
+                    last_flower = excluded.last_flower
+            """, (photo_hash, language, file_unique_id, file_id, result, access_token, flower))
+        except sqlite3.Error as e:
+            error_msg = f"Ошибка при запросе к СУБД: не удалось сохранить фото {photo_hash}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def set_photo_file_id(self, photo_hash: str, language: str, file_unique_id: str, file_id: str):
+        try:
+            await self._write("""
+                UPDATE photo_index
+                SET file_unique_id = ?, file_id = ?
+                WHERE photo_hash = ? AND language = ?
+            """, (file_unique_id, file_id, photo_hash, language))
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при запросе к СУБД: не удалось сохранить изображение для пользователя {user_id}: {e}"
+            error_msg = f"Ошибка при запросе к СУБД: не удалось обновить file_id для фото {photo_hash}: {e}"
             print(error_msg)
-            self.conn.rollback()
             raise Exception(error_msg) from e
 
-    async def get_image_base_64(self, user_id: int) -> Optional[str]:
+    async def get_photo_file_id(self, access_token: str) -> Optional[str]:
         try:
-            self.cursor.execute("SELECT image_base_64 FROM users WHERE id = ?", (user_id,))
-            res = self.cursor.fetchone()
+            res = await self._read("SELECT file_id FROM photo_index WHERE access_token = ? LIMIT 1", (access_token,))
             return res[0] if res and res[0] is not None else None
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при запросе к СУБД: не удалось получить изображение для пользователя {user_id}: {e}"
+            error_msg = f"Ошибка при запросе к СУБД: не удалось получить file_id для токена {access_token}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_photo_health(self, access_token: str, language: str) -> Optional[str]:
+        try:
+            res = await self._read("""
+                SELECT health FROM photo_index
+                WHERE access_token = ? AND language = ? AND health IS NOT NULL
+            """, (access_token, language))
+            return res[0] if res else None
+        except sqlite3.Error as e:
+            error_msg = f"Ошибка при запросе к СУБД: не удалось получить оценку здоровья для токена {access_token}: {e}"
             print(error_msg)
             raise Exception(error_msg) from e
 
-    async def set_last_flower(self, user_id: int, flower_name: str):
+    async def set_photo_health(self, access_token: str, language: str, health: str):
         try:
-            self.cursor.execute("""
-                INSERT INTO users (id, last_flower)
+            await self._write("""
+                UPDATE photo_index
+                SET health = ?
+                WHERE access_token = ? AND language = ?
+            """, (health, access_token, language))
+        except sqlite3.Error as e:
+            error_msg = f"Ошибка при запросе к СУБД: не удалось сохранить оценку здоровья для токена {access_token}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def get_image_file_ids(self, urls: List[str]) -> Dict[str, str]:
+        if not urls:
+            return {}
+        try:
+            placeholders = ", ".join("?" for _ in urls)
+            rows = await self._read(f"SELECT url, file_id FROM image_file_ids WHERE url IN ({placeholders})", urls,
+                                    fetch_all=True)
+            return {url: file_id for url, file_id in rows}
+        except sqlite3.Error as e:
+            error_msg = f"Ошибка при запросе к СУБД: не удалось получить file_id изображений: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def set_image_file_ids(self, file_ids: Dict[str, str]):
+        try:
+            await self._write("""
+                INSERT INTO image_file_ids (url, file_id)
                 VALUES (?, ?)
-                ON CONFLICT(id) DO UPDATE SET last_flower = excluded.last_flower
-            """, (user_id, flower_name))
-            self.conn.commit()
+                ON CONFLICT(url) DO UPDATE SET file_id = excluded.file_id
+            """, list(file_ids.items()), many=True)
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при запросе к СУБД: не удалось установить последний цветок для пользователя {user_id}: {e}"
+            error_msg = f"Ошибка при запросе к СУБД: не удалось сохранить file_id изображений: {e}"
             print(error_msg)
-            self.conn.rollback()
             raise Exception(error_msg) from e
 
-    async def get_last_flower(self, user_id: int) -> Optional[str]:
+    async def delete_image_file_ids(self, urls: List[str]):
         try:
-            self.cursor.execute("SELECT last_flower FROM users WHERE id = ?", (user_id,))
-            res = self.cursor.fetchone()
-            return res[0] if res and res[0] is not None else None
+            await self._write("DELETE FROM image_file_ids WHERE url = ?", [(url,) for url in urls], many=True)
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при запросе к СУБД: не удалось получить последний цветок для пользователя {user_id}: {e}"
+            error_msg = f"Ошибка при запросе к СУБД: не удалось удалить file_id изображений: {e}"
             print(error_msg)
             raise Exception(error_msg) from e
 
-    async def set_geoposition(self, user_id: int, longitude: float, latitude: float):
+    async def add_identification(self, user_id: int, access_token: str, flower: str, probability: float,
+                                 language: str, longitude: Optional[float], latitude: Optional[float],
+                                 image_hash: Optional[str], result: str):
         try:
-            self.cursor.execute("""
-                INSERT INTO users (id, longitude, latitude)
-                VALUES (?, ?, ?)
-                ON CONFLICT(id) DO UPDATE SET
-                    longitude = excluded.longitude,
-                    latitude = excluded.latitude
-            """, (user_id, longitude, latitude))
-            self.conn.commit()
+            await self._write("""
+                INSERT INTO identifications (user_id, access_token, flower, probability, language,
+                                             longitude, latitude, image_hash, result, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, access_token, flower, probability, language, longitude, latitude, image_hash, result,
+                  time.time()))
+        except sqlite3.Error as e:
+            error_msg = f"Ошибка при запросе к СУБД: не удалось сохранить историю для пользователя {user_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
+
+    async def copy_identification(self, user_id: int, access_token: str, longitude: Optional[float],
+                                  latitude: Optional[float], image_hash: Optional[str]):
+        """Добавляет в историю пользователя уже известное распознавание (повторное фото)."""
+        try:
+            await self._write("""
+                INSERT INTO identifications (user_id, access_token, flower, probability, language,
+                                             longitude, latitude, image_hash, result, created_at)
+                SELECT ?, access_token, flower, probability, language, ?, ?, COALESCE(?, image_hash), result, ?
+                FROM identifications
+                WHERE access_token = ?
+                ORDER BY id DESC
+                LIMIT 1
+            """, (user_id, longitude, latitude, image_hash, time.time(), access_token))
         except sqlite3.Error as e:
-            error_msg = (
-                f"Ошибка при сохранении геопозиции: пользователь {user_id}, "
-                f"долгота={longitude}, широта={latitude}: {e}"
-            )
+            error_msg = f"Ошибка при запросе к СУБД: не удалось сохранить историю для пользователя {user_id}: {e}"
             print(error_msg)
-            self.conn.rollback()
             raise Exception(error_msg) from e
 
-    async def get_geoposition(self, user_id: int) -> Optional[Tuple[float, float]]:
+    async def get_identifications(self, user_id: int, before_id: Optional[int] = None,
+                                  limit: int = 5) -> List[Tuple[int, str, float, float]]:
         try:
-            self.cursor.execute(
-                "SELECT longitude, latitude FROM users WHERE id = ?",
-                (user_id,)
-            )
-            result = self.cursor.fetchone()
+            return await self._read("""
+                SELECT id, flower, probability, created_at
+                FROM identifications
+                WHERE user_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            """, (user_id, before_id if before_id is not None else 2 ** 63 - 1, limit), fetch_all=True)
+        except sqlite3.Error as e:
+            error_msg = f"Ошибка при запросе к СУБД: не удалось получить историю пользователя {user_id}: {e}"
+            print(error_msg)
+            raise Exception(error_msg) from e
 
-            if result and result[0] is not None and result[1] is not None:
-                return result[0], result[1]
-            return None
+    async def get_identification(self, user_id: int,
+                                 identification_id: int) -> Optional[Tuple[str, str, str, Optional[str], str]]:
+        try:
+            return await self._read("""
+                SELECT access_token, flower, language, image_hash, result
+                FROM identifications
+                WHERE id = ? AND user_id = ?
+            """, (identification_id, user_id))
         except sqlite3.Error as e:
-            error_msg = f"Ошибка при получении геопозиции для пользователя {user_id}: {e}"
+            error_msg = f"Ошибка при запросе к СУБД: не удалось получить запись истории {identification_id}: {e}"
             print(error_msg)
             raise Exception(error_msg) from e
 
     def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._reader_lock:
+            for conn in self._reader_conns:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    print(f"Ошибка при закрытии соединения читателя с СУБД: {e}")
+            self._reader_conns.clear()
         if self.conn:
             try:
                 self.conn.close()
@@ -0,0 +1,93 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple, List, Dict
+
+from src.repository.session import UserSession
+
+
+class StateBackend(ABC):
+    """
+    Хранилище состояния бота: сессии пользователей, индекс фото,
+    кэши file_id и история распознаваний.
+
+    shared=True означает, что хранилище общее для нескольких процессов
+    бота, и держать в памяти копии сессий нельзя — их может поменять
+    другой процесс.
+    """
+
+    shared: bool = False
+
+    @abstractmethod
+    async def get_user_session(self, user_id: int) -> UserSession:
+        ...
+
+    @abstractmethod
+    async def save_user_session(self, session: UserSession):
+        ...
+
+    @abstractmethod
+    async def get_photo_by_file_id(self, file_unique_id: str, language: str) -> Optional[Tuple[str, str, str, str]]:
+        ...
+
+    @abstractmethod
+    async def get_photo_by_hash(self, photo_hash: str, language: str) -> Optional[Tuple[str, str, str]]:
+        ...
+
+    @abstractmethod
+    async def save_photo(self, photo_hash: str, language: str, file_unique_id: str, file_id: str,
+                         result: str, access_token: str, flower: str):
+        ...
+
+    @abstractmethod
+    async def set_photo_file_id(self, photo_hash: str, language: str, file_unique_id: str, file_id: str):
+        ...
+
+    @abstractmethod
+    async def get_photo_file_id(self, access_token: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def get_photo_health(self, access_token: str, language: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set_photo_health(self, access_token: str, language: str, health: str):
+        ...
+
+    @abstractmethod
+    async def get_image_file_ids(self, urls: List[str]) -> Dict[str, str]:
+        ...
+
+    @abstractmethod
+    async def set_image_file_ids(self, file_ids: Dict[str, str]):
+        ...
+
+    @abstractmethod
+    async def delete_image_file_ids(self, urls: List[str]):
+        ...
+
+    @abstractmethod
+    async def add_identification(self, user_id: int, access_token: str, flower: str, probability: float,
+                                 language: str, longitude: Optional[float], latitude: Optional[float],
+                                 image_hash: Optional[str], result: str):
+        ...
+
+    @abstractmethod
+    async def copy_identification(self, user_id: int, access_token: str, longitude: Optional[float],
+                                  latitude: Optional[float], image_hash: Optional[str]):
+        ...
+
+    @abstractmethod
+    async def get_identifications(self, user_id: int, before_id: Optional[int] = None,
+                                  limit: int = 5) -> List[Tuple[int, str, float, float]]:
+        ...
+
+    @abstractmethod
+    async def get_identification(self, user_id: int,
+                                 identification_id: int) -> Optional[Tuple[str, str, str, Optional[str], str]]:
+        ...
+
+    async def stop(self):
+        """Дописывает отложенные записи и отпускает сетевые ресурсы; вызывается внутри event loop."""
+
+    def close(self):
+        """Освобождает ресурсы после остановки event loop."""
@@ -0,0 +1,465 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру LRU-кэш с временем жизни записей.
+
+    При переполнении вытесняется самая давно использованная запись,
+    просроченные записи удаляются при обращении к ним.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return item[1] if item is not None else default
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TranslationCache:
+    """
+    Кэш переводов: LRU в памяти поверх таблицы translations в SQLite.
+
+    Память ограничена числом записей и суммарным размером в байтах,
+    записи старше ttl считаются промахом и в памяти, и на диске.
+    Пока attach() не вызван, кэш работает только в памяти. Таблицу
+    translations создают миграции базы бота.
+    """
+
+    def __init__(self, maxsize: int = 10000, max_bytes: int = 16 * 1024 * 1024, ttl: float = 30 * 24 * 3600.0):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def attach(self, db_path: str):
+        try:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA busy_timeout = 5000")
+            self.conn.execute("DELETE FROM translations WHERE created_at < ?", (time.time() - self.ttl,))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Кэш переводов работает только в памяти: {e}")
+            self.close()
+
+    @staticmethod
+    def _size(key: Tuple[str, str, str], value: str) -> int:
+        return len(key[0].encode('utf-8')) + len(value.encode('utf-8'))
+
+    def _remember(self, key: Tuple[str, str, str], value: str, created_at: float):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[2]
+        self._memory[key] = (created_at, value, size)
+        self._memory_bytes += size
+        while len(self._memory) > self.maxsize or self._memory_bytes > self.max_bytes:
+            self._memory_bytes -= self._memory.popitem(last=False)[1][2]
+
+    def peek(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
+        """
+        Проверка только памяти, безопасная для event loop: на диск не ходит
+        и не ждёт блокировку, которую держат потоки переводчика. Промах здесь
+        не считается — полноценный get() выполнится уже в потоке.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            key = (text, source_lang, target_lang)
+            item = self._memory.get(key)
+            if item is None or item[0] + self.ttl < time.time():
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return item[1]
+        finally:
+            self._lock.release()
+
+    def get(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
+        key = (text, source_lang, target_lang)
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and item[0] + self.ttl >= now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if self.conn is not None:
+                try:
+                    row = self.conn.execute("""
+                        SELECT translated, created_at FROM translations
+                        WHERE text = ? AND source_lang = ? AND target_lang = ?
+                    """, key).fetchone()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Ошибка чтения кэша переводов: {e}")
+                    row = None
+                if row and row[1] + self.ttl >= now:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def set(self, text: str, source_lang: str, target_lang: str, translated: str):
+        key = (text, source_lang, target_lang)
+        now = time.time()
+        with self._lock:
+            self._remember(key, translated, now)
+            if self.conn is not None:
+                try:
+                    self.conn.execute("""
+                        INSERT INTO translations (text, source_lang, target_lang, translated, created_at)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(text, source_lang, target_lang) DO UPDATE SET
+                            translated = excluded.translated,
+                            created_at = excluded.created_at
+                    """, (*key, translated, now))
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Ошибка записи в кэш переводов: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._memory),
+            "bytes": self._memory_bytes
+        }
+
+    def close(self):
+        if self.conn:
+            try:
+                self.conn.close()
+            except sqlite3.Error as e:
+                print(f"Ошибка при закрытии кэша переводов: {e}")
+            finally:
+                self.conn = None
+
+
+class NameCache:
+    """
+    Кэш соответствий «латинское название → название на языке пользователя».
+
+    Сначала проверяется офлайн-индекс из JSON-файла вида
+    {"ru": {"Monstera deliciosa": "Монстера деликатесная"}}, затем память и
+    таблица plant_names. Отрицательные ответы (страницы нет или она
+    неоднозначна) тоже кэшируются, но живут negative_ttl; для них хранится
+    не текст для пользователя, а данные (варианты неоднозначной страницы),
+    а текст на нужном языке собирается при чтении.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 180 * 24 * 3600.0, negative_ttl: float = 7 * 24 * 3600.0):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._index: Dict[Tuple[str, str], str] = {}
+        self._memory = TTLCache(maxsize, ttl)
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.index_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def load_index(self, path: str):
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось загрузить индекс названий растений {path}: {e}")
+            return
+        for language, names in index.items():
+            for latin_name, name in names.items():
+                self._index[(latin_name.strip().lower(), language)] = name
+        print(f"Загружен индекс названий растений: {len(self._index)} записей")
+
+    def attach(self, db_path: str):
+        try:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA busy_timeout = 5000")
+        except sqlite3.Error as e:
+            print(f"⚠️ Кэш названий растений работает только в памяти: {e}")
+            self.close()
+
+    def _db_get(self, key: Tuple[str, str]) -> Optional[Tuple[str, bool, float]]:
+        with self._lock:
+            if self.conn is None:
+                return None
+            try:
+                row = self.conn.execute("""
+                    SELECT name, found, created_at FROM plant_names
+                    WHERE latin_name = ? AND language = ?
+                """, key).fetchone()
+            except sqlite3.Error as e:
+                print(f"⚠️ Ошибка чтения кэша названий: {e}")
+                return None
+        return (row[0], bool(row[1]), row[2]) if row else None
+
+    def _db_set(self, key: Tuple[str, str], name: str, found: bool, created_at: float):
+        with self._lock:
+            if self.conn is None:
+                return
+            try:
+                self.conn.execute("""
+                    INSERT INTO plant_names (latin_name, language, name, found, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(latin_name, language) DO UPDATE SET
+                        name = excluded.name,
+                        found = excluded.found,
+                        created_at = excluded.created_at
+                """, (*key, name, int(found), created_at))
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Ошибка записи в кэш названий: {e}")
+
+    async def get(self, latin_name: str, language: str) -> Optional[Tuple[str, bool]]:
+        """Возвращает (название, найдено ли) или None, если в кэше ничего нет."""
+        key = (latin_name.strip().lower(), language)
+        if key in self._index:
+            self.index_hits += 1
+            return self._index[key], True
+        entry = self._memory.get(key)
+        if entry is not None:
+            return entry
+        row = await asyncio.to_thread(self._db_get, key)
+        if row is None:
+            self.misses += 1
+            return None
+        name, found, created_at = row
+        ttl = (self.ttl if found else self.negative_ttl) - (time.time() - created_at)
+        if ttl <= 0:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._memory.set(key, (name, found), ttl)
+        return name, found
+
+    async def set(self, latin_name: str, language: str, name: str, found: bool = True):
+        key = (latin_name.strip().lower(), language)
+        self._memory.set(key, (name, found), self.ttl if found else self.negative_ttl)
+        await asyncio.to_thread(self._db_set, key, name, found, time.time())
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.index_hits + self._memory.hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "index_hits": self.index_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": len(self._memory)
+        }
+
+    def close(self):
+        if self.conn:
+            try:
+                self.conn.close()
+            except sqlite3.Error as e:
+                print(f"Ошибка при закрытии кэша названий: {e}")
+            finally:
+                self.conn = None
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом в один.
+
+    Пока первый вызов не завершился, остальные ждут его результат
+    (или его исключение), а не запускают работу повторно.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение уже получил вызвавший, ожидающих может и не быть
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+class AdviceCache:
+    """
+    Кэш ответов LLM: TTL-кэш в памяти поверх таблицы advice в SQLite.
+
+    Ключ — строка, собранная вызывающим из нормализованных параметров
+    запроса. Одинаковые запросы, пришедшие одновременно, выполняются
+    один раз через SingleFlight.
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 30 * 24 * 3600.0):
+        self._memory = TTLCache(maxsize, ttl)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.disk_hits = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self._memory.maxsize
+
+    @maxsize.setter
+    def maxsize(self, value: int):
+        self._memory.maxsize = value
+
+    @property
+    def ttl(self) -> float:
+        return self._memory.ttl
+
+    @ttl.setter
+    def ttl(self, value: float):
+        self._memory.ttl = value
+
+    def attach(self, db_path: str):
+        try:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA busy_timeout = 5000")
+            self.conn.execute("DELETE FROM advice WHERE created_at < ?", (time.time() - self.ttl,))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Кэш советов работает только в памяти: {e}")
+            self.close()
+
+    def _db_get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            if self.conn is None:
+                return None
+            try:
+                return self.conn.execute("SELECT answer, created_at FROM advice WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"⚠️ Ошибка чтения кэша советов: {e}")
+                return None
+
+    def _db_set(self, key: str, answer: str, created_at: float):
+        with self._lock:
+            if self.conn is None:
+                return
+            try:
+                self.conn.execute("""
+                    INSERT INTO advice (key, answer, created_at) VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        answer = excluded.answer,
+                        created_at = excluded.created_at
+                """, (key, answer, created_at))
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Ошибка записи в кэш советов: {e}")
+
+    async def get(self, key: str) -> Optional[str]:
+        answer = self._memory.get(key)
+        if answer is not None:
+            return answer
+        row = await asyncio.to_thread(self._db_get, key)
+        if row is None:
+            return None
+        answer, created_at = row
+        ttl = self.ttl - (time.time() - created_at)
+        if ttl <= 0:
+            return None
+        self._memory.set(key, answer, ttl)
+        self.disk_hits += 1
+        return answer
+
+    async def set(self, key: str, answer: str):
+        self._memory.set(key, answer)
+        await asyncio.to_thread(self._db_set, key, answer, time.time())
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[str]]) -> str:
+        answer = await self.get(key)
+        if answer is not None:
+            return answer
+
+        async def load() -> str:
+            result = await fetch()
+            await self.set(key, result)
+            return result
+
+        return await self._flight.do(key, load)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._memory.hits + self._memory.misses
+        return {
+            "hits": self._memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self._memory.misses,
+            "hit_rate": (self._memory.hits + self.disk_hits) / total if total else 0.0,
+            "entries": len(self._memory)
+        }
+
+    def close(self):
+        if self.conn:
+            try:
+                self.conn.close()
+            except sqlite3.Error as e:
+                print(f"Ошибка при закрытии кэша советов: {e}")
+            finally:
+                self.conn = None
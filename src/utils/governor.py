@@ -0,0 +1,296 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+import aiohttp
+
+from src.i18n.catalog import catalog
+from src.utils.metrics import EXTERNAL_DURATION, EXTERNAL_IN_FLIGHT, Sample
+
+T = TypeVar('T')
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Ответы, по которым видно, что сервис запрос не выполнял: их можно повторять и для платных POST
+NOT_PROCESSED_STATUSES = {429, 503}
+
+
+class CircuitOpenError(Exception):
+    """Провайдер недавно падал подряд, и вызовы к нему временно не выполняются."""
+
+    def __init__(self, provider: str, title: str, retry_in: float):
+        super().__init__(f"{title} временно недоступен, повторите через {math.ceil(retry_in)} с")
+        self.provider = provider
+        self.title = title
+        self.retry_in = retry_in
+
+    def localized(self, language: str = 'ru') -> str:
+        return catalog.get('service_unavailable', language, service=self.title, seconds=max(1, math.ceil(self.retry_in)))
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Значение заголовка Retry-After из ответа с ошибкой: секунды или HTTP-дата."""
+    headers = getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderGovernor:
+    """
+    Ограничитель исходящих вызовов к одному внешнему сервису.
+
+    Одновременно выполняется не больше concurrency вызовов, каждая попытка
+    ограничена timeout. Временные ошибки (429/5xx, обрыв соединения,
+    таймаут и всё из retry_exceptions) повторяются до retries раз со
+    случайной экспоненциальной задержкой; Retry-After из ответа имеет
+    приоритет, а если он длиннее max_backoff, повтора нет. После
+    failure_threshold неудачных вызовов подряд предохранитель размыкается
+    на reset_timeout секунд: вызовы сразу падают с CircuitOpenError, затем
+    один пробный вызов решает, замкнуть его обратно или снова разомкнуть.
+
+    call() — для корутин, call_sync() — для блокирующих функций в потоках
+    (переводчик). Поток нельзя прервать, поэтому в call_sync timeout не
+    действует: срок попытки ограничивает таймаут сокета в самой функции.
+    Счётчики общие для обоих путей. Каждая попытка попадает в гистограмму
+    external_call_duration_seconds с меткой operation (эндпоинт или вид
+    запроса) и исходом ok/error/timeout.
+
+    Для неидемпотентных вызовов (idempotent=False, платные POST) таймаут
+    или обрыв посреди ответа не повторяются: запрос мог уже выполниться.
+    Повтор возможен, только если соединение не установилось или сервис
+    ответил 429/503.
+    """
+
+    def __init__(self,
+                 name: str,
+                 title: Optional[str] = None,
+                 concurrency: int = 10,
+                 timeout: Optional[float] = 30.0,
+                 retries: int = 2,
+                 backoff: float = 0.5,
+                 max_backoff: float = 10.0,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0,
+                 retry_exceptions: Tuple[Type[BaseException], ...] = ()):
+        self.name = name
+        self.title = title or name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retry_exceptions = retry_exceptions
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._thread_semaphore = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.counters: Dict[str, int] = {
+            'calls': 0, 'successes': 0, 'failures': 0, 'client_errors': 0, 'retries': 0,
+            'timeouts': 0, 'rejected': 0, 'in_flight': 0
+        }
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def _count(self, counter: str, delta: int = 1):
+        with self._lock:
+            self.counters[counter] += delta
+
+    def _enter(self) -> float:
+        self._count('in_flight')
+        EXTERNAL_IN_FLIGHT.inc(provider=self.name)
+        return time.perf_counter()
+
+    def _leave(self, started: float, operation: str, outcome: str):
+        self._count('in_flight', -1)
+        EXTERNAL_IN_FLIGHT.dec(provider=self.name)
+        EXTERNAL_DURATION.observe(time.perf_counter() - started, provider=self.name, operation=operation,
+                                  outcome=outcome)
+
+    def _admit(self):
+        with self._lock:
+            self.counters['calls'] += 1
+            if self._opened_at is None:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed >= self.reset_timeout and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.counters['rejected'] += 1
+            raise CircuitOpenError(self.name, self.title, max(0.0, self.reset_timeout - elapsed))
+
+    def _record(self, outcome: str):
+        """outcome: 'success', 'client_error' (сервис ответил, но запрос плохой) или 'failure'."""
+        with self._lock:
+            self._probe_in_flight = False
+            if outcome != 'failure':
+                self.counters['successes' if outcome == 'success' else 'client_errors'] += 1
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+            self.counters['failures'] += 1
+            self._consecutive_failures += 1
+            if self._opened_at is not None or self._consecutive_failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"⚠️ {self.title}: {self._consecutive_failures} ошибок подряд, приостанавливаем вызовы")
+                self._opened_at = time.monotonic()
+
+    def _is_transient(self, error: BaseException) -> bool:
+        if isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError)):
+            return True
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in RETRY_STATUSES
+        status = getattr(error, 'status', None)
+        if isinstance(status, int):
+            return status in RETRY_STATUSES
+        return bool(self.retry_exceptions) and isinstance(error, self.retry_exceptions)
+
+    def _should_retry(self, error: BaseException, idempotent: bool) -> bool:
+        if not self._is_transient(error):
+            return False
+        if idempotent or isinstance(error, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError)):
+            return True
+        return getattr(error, 'status', None) in NOT_PROCESSED_STATUSES
+
+    def _delay(self, attempt: int, error: BaseException) -> Optional[float]:
+        """Пауза перед повтором или None, если сервис просит ждать дольше max_backoff."""
+        delay = retry_after(error)
+        if delay is not None:
+            return delay if delay <= self.max_backoff else None
+        # «Full jitter»: случайная пауза до экспоненциально растущего предела
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def call(self, func: Callable[[], Awaitable[T]], operation: str = 'call', idempotent: bool = True) -> T:
+        self._admit()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    async with self.semaphore:
+                        started = self._enter()
+                        outcome = 'error'
+                        try:
+                            if self.timeout is None:
+                                result = await func()
+                            else:
+                                result = await asyncio.wait_for(func(), self.timeout)
+                            outcome = 'ok'
+                        except asyncio.TimeoutError:
+                            outcome = 'timeout'
+                            raise
+                        finally:
+                            self._leave(started, operation, outcome)
+                except asyncio.TimeoutError:
+                    self._count('timeouts')
+                    error = asyncio.TimeoutError(f"{self.title}: нет ответа за {self.timeout} с")
+                except Exception as e:
+                    error = e
+                else:
+                    self._record('success')
+                    return result
+                delay = self._delay(attempt, error)
+                if not self._should_retry(error, idempotent) or attempt >= self.retries or delay is None:
+                    raise error
+                self._count('retries')
+                await asyncio.sleep(delay)
+                attempt += 1
+        except asyncio.CancelledError:
+            with self._lock:
+                self._probe_in_flight = False
+            raise
+        except Exception as e:
+            # Ошибки клиента (4xx, битый ответ) — не повод размыкать предохранитель
+            self._record('failure' if self._is_transient(e) else 'client_error')
+            raise
+
+    def call_sync(self, func: Callable[[], T], operation: str = 'call', idempotent: bool = True) -> T:
+        self._admit()
+        attempt = 0
+        try:
+            while True:
+                with self._thread_semaphore:
+                    started = self._enter()
+                    outcome = 'error'
+                    try:
+                        result = func()
+                        outcome = 'ok'
+                    except Exception as e:
+                        error = e
+                    else:
+                        self._record('success')
+                        return result
+                    finally:
+                        self._leave(started, operation, outcome)
+                delay = self._delay(attempt, error)
+                if not self._should_retry(error, idempotent) or attempt >= self.retries or delay is None:
+                    raise error
+                self._count('retries')
+                time.sleep(delay)
+                attempt += 1
+        except Exception as e:
+            self._record('failure' if self._is_transient(e) else 'client_error')
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+        stats['state'] = self.state
+        return stats
+
+
+governors: Dict[str, ProviderGovernor] = {}
+
+
+def governor(name: str) -> ProviderGovernor:
+    if name not in governors:
+        governors[name] = ProviderGovernor(name)
+    return governors[name]
+
+
+def configure_governor(name: str, title: Optional[str] = None, **kwargs: Any) -> ProviderGovernor:
+    governors[name] = ProviderGovernor(name, title, **kwargs)
+    return governors[name]
+
+
+def governor_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: item.stats() for name, item in governors.items()}
+
+
+def governor_samples() -> List[Sample]:
+    """Счётчики и состояние предохранителей всех провайдеров для /metrics."""
+    samples: List[Sample] = []
+    for name, stats in governor_stats().items():
+        labels = {'provider': name}
+        for counter in ('calls', 'successes', 'failures', 'client_errors', 'retries', 'timeouts', 'rejected'):
+            samples.append((f'external_{counter}_total', 'counter', f'Governor: {counter}', labels, stats[counter]))
+        samples.append(('external_circuit_open', 'gauge', 'Предохранитель разомкнут (1) или замкнут (0)', labels,
+                        0 if stats['state'] == 'closed' else 1))
+    return samples
@@ -0,0 +1,216 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Сэмпл от коллектора: имя, тип, описание, метки, значение
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + '}'
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """Общая часть метрик: имя, описание, имена меток и значения по наборам меток."""
+
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def _render_values(self) -> List[str]:
+        """Строки сэмплов без HELP/TYPE; вызывается под self._lock."""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            lines.extend(self._render_values())
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _render_values(self) -> List[str]:
+        return [f"{self.name}{_labels(dict(zip(self.labelnames, key)))} {_number(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels: Any) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_values(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': _number(bound)})} {count}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Набор метрик процесса и его текстовое представление для Prometheus.
+
+    Кроме собственных метрик есть коллекторы — функции, которые в момент
+    выдачи читают уже существующие счётчики (статистику кэшей, governor)
+    и возвращают их сэмплами.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def _register(self, metric: Metric) -> Any:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        # Сэмплы одного семейства должны идти подряд, поэтому сначала группируем по имени
+        families: Dict[str, Tuple[str, str, List[str]]] = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"⚠️ Ошибка сбора метрик: {e}")
+                continue
+            for name, kind, documentation, labels, value in samples:
+                family = families.setdefault(name, (kind, documentation, []))
+                family[2].append(f"{name}{_labels(labels)} {_number(value)}")
+        for name, (kind, documentation, family_lines) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(family_lines)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_DURATION = registry.histogram('bot_handler_duration_seconds', 'Время обработки апдейта обработчиком',
+                                      ['handler'])
+HANDLER_ERRORS = registry.counter('bot_handler_errors_total', 'Исключения, вылетевшие из обработчика', ['handler'])
+HANDLER_IN_FLIGHT = registry.gauge('bot_handler_in_flight', 'Апдейты, которые обрабатываются сейчас', ['handler'])
+STAGE_DURATION = registry.histogram('bot_stage_duration_seconds', 'Время отдельных этапов обработки', ['stage'])
+EXTERNAL_DURATION = registry.histogram('external_call_duration_seconds',
+                                       'Время одной попытки вызова внешнего сервиса',
+                                       ['provider', 'operation', 'outcome'])
+EXTERNAL_IN_FLIGHT = registry.gauge('external_calls_in_flight', 'Выполняющиеся вызовы внешних сервисов',
+                                    ['provider'])
+STORAGE_DURATION = registry.histogram('storage_call_duration_seconds', 'Время запроса к хранилищу состояния',
+                                      ['backend', 'kind'])
+STORAGE_ERRORS = registry.counter('storage_errors_total', 'Ошибки запросов к хранилищу состояния',
+                                  ['backend', 'kind'])
+
+
+def cache_samples(name: str, hits: float, misses: float, entries: Optional[float] = None) -> List[Sample]:
+    """Сэмплы попаданий и промахов кэша плюс готовая доля попаданий."""
+    labels = {'cache': name}
+    total = hits + misses
+    samples = [
+        ('cache_hits_total', 'counter', 'Попадания в кэш', labels, hits),
+        ('cache_misses_total', 'counter', 'Промахи кэша', labels, misses),
+        ('cache_hit_ratio', 'gauge', 'Доля попаданий в кэш с запуска', labels, hits / total if total else 0.0),
+    ]
+    if entries is not None:
+        samples.append(('cache_entries', 'gauge', 'Записей в кэше в памяти', labels, entries))
+    return samples
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=registry.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
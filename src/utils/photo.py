@@ -0,0 +1,127 @@
+import base64
+import io
+import json
+import math
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+from aiogram.types import PhotoSize
+
+from src.repository.blob.blob import BytesLike
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow нужен только для пережатия под лимит размера
+    Image = None
+
+JPEG_QUALITIES = (85, 75, 65, 55)
+MIN_SIDE = 512
+# Кратно 3, чтобы куски base64 склеивались без паддинга посередине
+ENCODE_CHUNK = 3 * 16 * 1024
+
+
+def select_photo_size(sizes: Sequence[PhotoSize], target_side: int) -> PhotoSize:
+    """
+    Выбирает самый маленький размер фото, у которого длинная сторона не
+    меньше target_side. Если такого нет, берётся самый большой.
+    """
+    ordered = sorted(sizes, key=lambda size: (size.width * size.height, size.file_size or 0))
+    for size in ordered:
+        if max(size.width, size.height) >= target_side:
+            return size
+    return ordered[-1]
+
+
+def recompression_available() -> bool:
+    return Image is not None
+
+
+def fit_to_budget(data: BytesLike, max_bytes: int, max_side: int) -> BytesLike:
+    """
+    Уменьшает и пережимает фото в JPEG, пока оно не влезет в max_bytes.
+
+    Длинная сторона сначала ограничивается max_side, затем перебирается
+    качество из JPEG_QUALITIES, и если этого мало, сторона уменьшается ещё
+    (но не ниже MIN_SIDE). Без Pillow, при max_bytes <= 0 или если пережать
+    не вышло, возвращается тот же объект data.
+    """
+    if max_bytes <= 0 or len(data) <= max_bytes or Image is None:
+        return data
+    try:
+        source = data if isinstance(data, mmap.mmap) else io.BytesIO(data)
+        with Image.open(source) as image:
+            image = image.convert('RGB')
+            side = min(max_side, max(image.size))
+            best: Optional[bytes] = None
+            while True:
+                resized = image.copy()
+                resized.thumbnail((side, side))
+                for quality in JPEG_QUALITIES:
+                    buffer = io.BytesIO()
+                    resized.save(buffer, format='JPEG', quality=quality, optimize=True)
+                    best = buffer.getvalue()
+                    if len(best) <= max_bytes:
+                        return best
+                if side <= MIN_SIDE:
+                    return best if len(best) < len(data) else data
+                side = max(MIN_SIDE, int(side * 0.8))
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Не удалось пережать фото: {e}")
+        return data
+
+
+class PreparedPhoto:
+    """
+    Фото, подготовленное к отправке в Plant.id: путь к блобу на диске или
+    байты в памяти.
+
+    json_body() собирает тело запроса потоком: base64 кодируется кусками
+    прямо из отображённого в память файла, так что ни полная base64-строка,
+    ни копия фото в куче не создаются. Один и тот же объект используют
+    идентификация и оценка здоровья, каждый запрос открывает свой mmap.
+    """
+
+    def __init__(self, data: Optional[BytesLike] = None, path: Optional[str] = None):
+        if (data is None) == (path is None):
+            raise ValueError("Нужно передать либо data, либо path")
+        self.data = data
+        self.path = path
+
+    @classmethod
+    def of(cls, photo: Union[BytesLike, "PreparedPhoto"]) -> "PreparedPhoto":
+        return photo if isinstance(photo, cls) else cls(data=photo)
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path) if self.path is not None else len(self.data)
+
+    @contextmanager
+    def view(self) -> Iterator[memoryview]:
+        if self.path is None:
+            with memoryview(self.data) as view:
+                yield view
+            return
+        with open(self.path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                yield view
+
+    def json_body(self, fields: Dict[str, Any], key: str = 'images') -> Tuple[AsyncIterator[bytes], int]:
+        """
+        Тело {**fields, key: [<base64>]} кусками и его точная длина
+        (для Content-Length, чтобы обойтись без chunked-кодирования).
+        """
+        head = json.dumps(fields, ensure_ascii=False, separators=(',', ':'))[:-1]
+        prefix = f'{head}{"," if fields else ""}"{key}":["'.encode('utf-8')
+        suffix = b'"]}'
+        length = len(prefix) + 4 * math.ceil(self.size / 3) + len(suffix)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            yield prefix
+            with self.view() as view:
+                for start in range(0, len(view), ENCODE_CHUNK):
+                    yield base64.b64encode(view[start:start + ENCODE_CHUNK])
+            yield suffix
+
+        return chunks(), length
@@ -1,24 +1,106 @@
-from typing import Dict, Any, Tuple, Optional, Union, List
+import asyncio
+import functools
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Tuple, Optional, Union, List, Callable
 
 import aiohttp
-import wikipedia
+import deep_translator.google
+import requests
 from aiogram.types import BufferedInputFile
 from aiogram.utils.media_group import MediaGroupBuilder
 from deep_translator import GoogleTranslator
 
+from src.i18n.catalog import catalog
+from src.utils.cache import TranslationCache, NameCache
+from src.utils.governor import CircuitOpenError, governor
 
-def get_russian_name_from_latin(latin_name: str, lang: str) -> str:
-    wikipedia.set_lang(lang)
-    try:
-        page = wikipedia.page(latin_name)
-        return page.title
-    except wikipedia.exceptions.DisambiguationError as e:
-        return f"Неоднозначность: {e.options[:5]}"
-    except wikipedia.exceptions.PageError:
-        return "Не нашёл русского названия"
+
+WIKIPEDIA_API_URL = "https://{lang}.wikipedia.org/w/api.php"
+
+
+def negative_name(titles: str, lang: str) -> str:
+    """Текст для отсутствующей или неоднозначной (titles — варианты) страницы."""
+    if titles:
+        return catalog.get('name_ambiguous', lang, titles=titles)
+    return catalog.get('name_not_found', lang)
 
 
-translation_cache = {}
+async def get_russian_name_from_latin(
+        latin_name: str,
+        lang: str,
+        session: Optional[aiohttp.ClientSession] = None,
+        timeout: float = 10.0
+) -> str:
+    """
+    Ищет статью Википедии по латинскому названию и возвращает её заголовок.
+
+    Сначала смотрит в name_cache (офлайн-индекс, память, SQLite); найденные
+    и отсутствующие/неоднозначные страницы кэшируются. Язык передаётся в URL
+    каждого запроса, поэтому параллельные пользователи с разными языками не
+    мешают друг другу. При сетевой ошибке или таймауте возвращается само
+    латинское название, и оно не кэшируется.
+    """
+    cached = await name_cache.get(latin_name, lang)
+    if cached is not None:
+        name, found = cached
+        return name if found else negative_name(name, lang)
+
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession()
+    url = WIKIPEDIA_API_URL.format(lang=lang or 'ru')
+    params = {
+        'action': 'query',
+        'format': 'json',
+        'generator': 'search',
+        'gsrsearch': latin_name,
+        'gsrlimit': 1,
+        'prop': 'pageprops',
+        'ppprop': 'disambiguation',
+        'redirects': 1
+    }
+    try:
+        request_timeout = aiohttp.ClientTimeout(total=timeout)
+
+        async def query(query_params: Dict[str, Any]) -> Dict[str, Any]:
+            async with session.get(url, params=query_params, timeout=request_timeout) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        data = await governor('wikipedia').call(lambda: query(params), operation='page')
+        pages = list(data.get('query', {}).get('pages', {}).values())
+        if not pages:
+            await name_cache.set(latin_name, lang, '', found=False)
+            return negative_name('', lang)
+        page = pages[0]
+        if 'disambiguation' not in page.get('pageprops', {}):
+            await name_cache.set(latin_name, lang, page['title'])
+            return page['title']
+
+        links_params = {
+            'action': 'query',
+            'format': 'json',
+            'titles': page['title'],
+            'prop': 'links',
+            'plnamespace': 0,
+            'pllimit': 5
+        }
+        data = await governor('wikipedia').call(lambda: query(links_params), operation='links')
+        links = next(iter(data.get('query', {}).get('pages', {}).values()), {}).get('links', [])
+        titles = ', '.join(link['title'] for link in links[:5])
+        await name_cache.set(latin_name, lang, titles, found=False)
+        return negative_name(titles, lang)
+    except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError, KeyError, ValueError) as e:
+        print(f"⚠️ Ошибка запроса к Википедии для '{latin_name}': {e!r}")
+        return latin_name
+    finally:
+        if own_session:
+            await session.close()
+
+
+translation_cache = TranslationCache()
+name_cache = NameCache()
 
 
 def safe_translate(text: Union[str, List[str]], source_lang: str = 'auto', target_lang: str = 'ru') -> Union[
@@ -29,14 +111,15 @@ def safe_translate(text: Union[str, List[str]], source_lang: str = 'auto', targe
         if not text.strip():
             return text
 
-        cache_key = (text.strip(), source_lang, target_lang)
-        if cache_key in translation_cache:
-            return translation_cache[cache_key]
+        cached = translation_cache.get(text.strip(), source_lang, target_lang)
+        if cached is not None:
+            return cached
 
         try:
             translator = GoogleTranslator(source=source_lang, target=target_lang)
-            translated = translator.translate(text.strip())
-            translation_cache[cache_key] = translated
+            translated = governor('translator').call_sync(lambda: translator.translate(text.strip()),
+                                                          operation='text')
+            translation_cache.set(text.strip(), source_lang, target_lang, translated)
             return translated
         except Exception as e:
             print(f"⚠️ Ошибка перевода '{text[:30]}...': {str(e)}")
@@ -57,6 +140,160 @@ def safe_translate(text: Union[str, List[str]], source_lang: str = 'auto', targe
         print(f"⚠️ Неподдерживаемый тип: {type(text)}")
         return text
 
+translation_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='translator')
+
+
+class _TimeoutRequests:
+    """
+    requests для deep_translator.google с таймаутом по умолчанию: сама
+    библиотека вызывает requests.get без timeout, и зависший запрос навсегда
+    занимал бы поток переводчика и слот governor.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+
+    def get(self, *args: Any, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return requests.get(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(requests, name)
+
+
+def set_translator_timeout(timeout: float):
+    deep_translator.google.requests = _TimeoutRequests(timeout)
+
+
+set_translator_timeout(10.0)
+
+
+def set_translation_workers(workers: int):
+    global translation_executor
+    translation_executor.shutdown(wait=False)
+    translation_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='translator')
+
+
+async def run_in_translator(func: Callable[..., Any], *args: Any, timeout: float = 30.0) -> Any:
+    """
+    Выполняет блокирующую функцию с обращениями к переводчику в отдельном
+    пуле потоков, не занимая event loop. По истечении timeout бросает
+    asyncio.TimeoutError; сам поток при этом доработает в фоне.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(translation_executor, functools.partial(func, *args)),
+                                  timeout)
+
+
+async def safe_translate_async(text: Union[str, List[str]], source_lang: str = 'auto', target_lang: str = 'ru',
+                               timeout: float = 10.0) -> Union[str, List[str]]:
+    if isinstance(text, str) and text.strip():
+        # На event loop — только память; SQLite-слой кэша проверит safe_translate в потоке
+        cached = translation_cache.peek(text.strip(), source_lang, target_lang)
+        if cached is not None:
+            return cached
+    try:
+        return await run_in_translator(safe_translate, text, source_lang, target_lang, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Перевод не уложился в {timeout} с, оставляем исходный текст")
+        return text
+
+
+TRANSLATE_BATCH_LIMIT = 4500
+CYRILLIC = re.compile('[а-яА-ЯёЁ]')
+
+
+def translate_batch(texts: List[str], source_lang: str = 'auto', target_lang: str = 'ru') -> Dict[str, str]:
+    """
+    Переводит список строк, отправляя все промахи кэша несколькими пачками,
+    и возвращает переводы по очищенному от пробелов тексту.
+
+    Каждая строка проверяется в кэше ровно один раз. Строки склеиваются
+    через перевод строки в запросы до TRANSLATE_BATCH_LIMIT символов;
+    кириллица и остальной текст идут разными пачками, чтобы автоопределение
+    языка не путалось. Если пачка вернулась с другим числом строк, её
+    элементы в результат не попадают и потом переводятся по одному.
+    """
+    translations: Dict[str, str] = {}
+    pending = []
+    for text in texts:
+        if isinstance(text, str) and text.strip() and '\n' not in text.strip():
+            key = text.strip()
+            if key in translations or key in pending:
+                continue
+            cached = translation_cache.get(key, source_lang, target_lang)
+            if cached is None:
+                pending.append(key)
+            else:
+                translations[key] = cached
+
+    groups = [[t for t in pending if CYRILLIC.search(t)], [t for t in pending if not CYRILLIC.search(t)]]
+    for group in groups:
+        chunks, chunk, size = [], [], 0
+        for text in group:
+            if chunk and size + len(text) + 1 > TRANSLATE_BATCH_LIMIT:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(text)
+            size += len(text) + 1
+        if chunk:
+            chunks.append(chunk)
+
+        for chunk in chunks:
+            try:
+                translator = GoogleTranslator(source=source_lang, target=target_lang)
+                translated = governor('translator').call_sync(
+                    lambda: translator.translate("\n".join(chunk)), operation='batch'
+                ).split("\n")
+            except Exception as e:
+                print(f"⚠️ Ошибка пакетного перевода ({len(chunk)} строк): {str(e)}")
+                continue
+            if len(translated) != len(chunk):
+                print(f"⚠️ Пакетный перевод вернул {len(translated)} строк вместо {len(chunk)}, переводим по одной")
+                continue
+            for text, result in zip(chunk, translated):
+                translations[text] = result.strip()
+                translation_cache.set(text, source_lang, target_lang, result.strip())
+
+    return translations
+
+
+def prefetch_translations(render: Callable[..., Any], *args: Any, target_lang: str = 'ru') -> Callable[..., Any]:
+    """
+    Прогоняет функцию форматирования вхолостую, собирает все строки, которые она
+    переводит, переводит их одной пачкой и возвращает функцию перевода для
+    настоящего вызова: она отдаёт готовые переводы, не обращаясь к кэшу
+    повторно, а всё остальное передаёт в safe_translate.
+    """
+    texts = []
+
+    def collect(text: Union[str, List[str]], source_lang: str = 'auto', target_lang: str = 'ru'):
+        if isinstance(text, str):
+            texts.append(text)
+        elif isinstance(text, list):
+            texts.extend(item for item in text if isinstance(item, str))
+        return text
+
+    try:
+        render(*args, translate=collect)
+    except Exception as e:
+        print(f"⚠️ Не удалось собрать строки для пакетного перевода: {e}")
+    translations = translate_batch(texts, target_lang=target_lang)
+    prefetched_lang = target_lang
+
+    def translate(text: Union[str, List[str]], source_lang: str = 'auto',
+                  target_lang: str = 'ru') -> Union[str, List[str]]:
+        if source_lang != 'auto' or target_lang != prefetched_lang:
+            return safe_translate(text, source_lang, target_lang)
+        if isinstance(text, list):
+            return [translate(item, source_lang, target_lang) if isinstance(item, str) else item for item in text]
+        if isinstance(text, str) and text.strip() in translations:
+            return translations[text.strip()]
+        return safe_translate(text, source_lang, target_lang)
+
+    return translate
+
+
 def list_to_string(value: Any) -> str:
     if isinstance(value, list):
         return ", ".join(str(item) for item in value)
@@ -68,8 +305,11 @@ def list_to_string(value: Any) -> str:
 
 def format_plant_details(
         json_data: Dict[str, Any],
-        language: str = 'ru'
+        language: str = 'ru',
+        translate: Callable[..., Any] = safe_translate
 ) -> str:
+    if translate is safe_translate and language != 'ru':
+        translate = prefetch_translations(format_plant_details, json_data, language, target_lang=language)
     try:
         result_data = json_data.get('result', {})
         classification = result_data.get('classification', {})
@@ -79,7 +319,7 @@ def format_plant_details(
         if not isinstance(details, dict):
             details = {}
 
-        latin_name = plant.get('name', 'Неизвестное растение')
+        latin_name = plant.get('name', catalog.get('details_default_name', language))
         common_names = details.get('common_names', [])
         if isinstance(common_names, str):
             common_names = [common_names]
@@ -87,48 +327,27 @@ def format_plant_details(
             common_names = []
 
         if language != 'ru':
-            plant_names_list = [safe_translate(name, target_lang=language) for name in
-                                common_names] if common_names else []
-            plant_names = " / ".join(plant_names_list) if plant_names_list else safe_translate("Информация о растении",
-                                                                                               target_lang=language)
-            section_title_main = safe_translate("### 🌸 {name}", target_lang=language).replace("{name}", plant_names)
-            section_title_latin = safe_translate("Латинское название", target_lang=language)
-        else:
-            plant_names = " / ".join(common_names) if common_names else "Информация о растении"
-            section_title_main = f"### 🌸 {plant_names}"
-            section_title_latin = "Латинское название"
+            common_names = [translate(name, target_lang=language) for name in common_names]
+        plant_names = " / ".join(common_names) if common_names else catalog.get('details_default_name', language)
+        section_title_main = catalog.get('details_title', language, name=plant_names)
+        section_title_latin = catalog.get('latin_name', language)
 
         result = [f"<b>{section_title_main}</b>", f"<b>{section_title_latin}</b>: <i>{latin_name}</i>\n"]
 
         if taxonomy := details.get('taxonomy', {}):
             if isinstance(taxonomy, dict):
-                tax_title = "#### 🌿 Таксономия"
-                if language != 'ru':
-                    tax_title = safe_translate(tax_title, target_lang=language)
-                result.append(f"<b>{tax_title}</b>")
-                tax_map = {
-                    'kingdom': 'Царство',
-                    'phylum': 'Отдел',
-                    'class': 'Класс',
-                    'order': 'Порядок',
-                    'family': 'Семейство',
-                    'genus': 'Род'
-                }
-                for key, ru_title in tax_map.items():
+                result.append(f"<b>{catalog.get('taxonomy_title', language)}</b>")
+                for key in ('kingdom', 'phylum', 'class', 'order', 'family', 'genus'):
                     if value := taxonomy.get(key):
-                        title_trans = safe_translate(ru_title, target_lang=language) if language != 'ru' else ru_title
-                        result.append(f"<b>{title_trans}</b>: {value}")
+                        result.append(f"<b>{catalog.get(f'taxonomy_{key}', language)}</b>: {value}")
                 result.append("")
 
         # Синонимы
         if synonyms := details.get('synonyms', []):
             if isinstance(synonyms, list):
-                syn_title = "#### 🔍 Синонимы"
-                if language != 'ru':
-                    syn_title = safe_translate(syn_title, target_lang=language)
-                result.append(f"<b>{syn_title}</b>")
+                result.append(f"<b>{catalog.get('synonyms_title', language)}</b>")
                 for synonym in synonyms:
-                    trans_syn = safe_translate(synonym, target_lang=language) if language != 'ru' else synonym
+                    trans_syn = translate(synonym, target_lang=language) if language != 'ru' else synonym
                     result.append(f"<i>{trans_syn}</i>")
                 result.append("")
 
@@ -144,49 +363,32 @@ def format_plant_details(
                     try:
                         min_val = float(min_val)
                         max_val = float(max_val)
-                        freq_key = "Частота"
                         if min_val == max_val:
-                            freq = f"{int(min_val)} раз{'а' if 2 <= min_val <= 4 else ''}"
+                            key = 'watering_times_few' if 2 <= min_val <= 4 else 'watering_times'
+                            freq = catalog.get(key, language, count=int(min_val))
                         else:
-                            freq = f"{int(min_val)}–{int(max_val)} раз в неделю"
-                        if language != 'ru':
-                            freq_key = safe_translate(freq_key, target_lang=language)
-                        watering_text.append(f"<b>{freq_key}</b>: {freq}")
+                            freq = catalog.get('watering_range', language, min=int(min_val), max=int(max_val))
+                        watering_text.append(f"<b>{catalog.get('watering_frequency', language)}</b>: {freq}")
                     except (TypeError, ValueError):
                         pass
 
         if best_watering := details.get('best_watering'):
-            label = "Рекомендации"
-            if language != 'ru':
-                label = safe_translate(label, target_lang=language)
-            best_watering = safe_translate(best_watering, target_lang=language)
-            watering_text.append(f"<b>{label}</b>: {best_watering}")
+            best_watering = translate(best_watering, target_lang=language)
+            watering_text.append(f"<b>{catalog.get('recommendations', language)}</b>: {best_watering}")
 
         if watering_text:
-            section = "💧 Полив"
-            if language != 'ru':
-                section = safe_translate(section, target_lang=language)
-            care_sections.append(f"<b>{section}</b>\n" + "\n".join(watering_text))
+            care_sections.append(f"<b>{catalog.get('watering_title', language)}</b>\n" + "\n".join(watering_text))
 
         if light := details.get('best_light_condition'):
-            label = "☀️ Освещение"
-            if language != 'ru':
-                label = safe_translate(label, target_lang=language)
-            light = safe_translate(light, target_lang=language)
-            care_sections.append(f"<b>{label}</b>\n— {light}")
+            light = translate(light, target_lang=language)
+            care_sections.append(f"<b>{catalog.get('light_title', language)}</b>\n— {light}")
 
         if soil := details.get('best_soil_type'):
-            label = "🌱 Почва"
-            if language != 'ru':
-                label = safe_translate(label, target_lang=language)
-            soil = safe_translate(soil, target_lang=language)
-            care_sections.append(f"<b>{label}</b>\n— {soil}")
+            soil = translate(soil, target_lang=language)
+            care_sections.append(f"<b>{catalog.get('soil_title', language)}</b>\n— {soil}")
 
         if care_sections:
-            care_title = "#### 💧 Уход за растением"
-            if language != 'ru':
-                care_title = safe_translate(care_title, target_lang=language)
-            result.append(f"<b>{care_title}</b>")
+            result.append(f"<b>{catalog.get('care_title', language)}</b>")
             result.extend(care_sections)
             result.append("")
 
@@ -194,210 +396,214 @@ def format_plant_details(
         usage_sections = []
 
         if toxicity := details.get('toxicity'):
-            label = "⚠️ Токсичность"
-            if language != 'ru':
-                label = safe_translate(label, target_lang=language)
-            toxicity = safe_translate(toxicity, target_lang=language)
-            usage_sections.append(f"<b>{label}</b>\n— {toxicity}")
+            toxicity = translate(toxicity, target_lang=language)
+            usage_sections.append(f"<b>{catalog.get('toxicity_title', language)}</b>\n— {toxicity}")
 
         if uses := details.get('common_uses'):
-            label = "🌼 Применение"
-            if language != 'ru':
-                label = safe_translate(label, target_lang=language)
-            uses = safe_translate(uses, target_lang=language)
-            usage_sections.append(f"<b>{label}</b>\n— {uses}")
+            uses = translate(uses, target_lang=language)
+            usage_sections.append(f"<b>{catalog.get('uses_title', language)}</b>\n— {uses}")
 
         if culture := details.get('cultural_significance'):
-            label = "🎎 Культурное значение"
-            if language != 'ru':
-                label = safe_translate(label, target_lang=language)
-            culture = safe_translate(culture, target_lang=language)
-            usage_sections.append(f"<b>{label}</b>\n— {culture}")
+            culture = translate(culture, target_lang=language)
+            usage_sections.append(f"<b>{catalog.get('culture_title', language)}</b>\n— {culture}")
 
         if usage_sections:
-            title = "#### 🌼 Применение и особенности"
-            if language != 'ru':
-                title = safe_translate(title, target_lang=language)
-            result.append(f"<b>{title}</b>")
+            result.append(f"<b>{catalog.get('usage_title', language)}</b>")
             result.extend(usage_sections)
             result.append("")
 
         # Дополнительно
         extra_info = []
 
-        edible = details.get('edible_parts')
-        edible_label = "Съедобные части"
-        if edible:
-            edible = safe_translate(edible, target_lang=language)
-            edible_label = safe_translate(edible_label, target_lang=language)
+        edible_label = catalog.get('edible_parts', language)
+        if edible := details.get('edible_parts'):
+            edible = translate(edible, target_lang=language)
             extra_info.append(f"<b>{edible_label}</b>: {edible}")
         else:
-            value = "Не указаны"
-            if language != 'ru':
-                edible_label = safe_translate(edible_label, target_lang=language)
-            value = safe_translate(value, target_lang=language)
-            extra_info.append(f"<b>{edible_label}</b>: {value}")
-
-        propagation = details.get('propagation_methods')
-        prop_label = "Способы размножения"
-        if propagation:
-            if language != 'ru':
-                prop_label = safe_translate(prop_label, target_lang=language)
-            propagation = safe_translate(propagation, target_lang=language)
+            extra_info.append(f"<b>{edible_label}</b>: {catalog.get('not_specified', language)}")
+
+        prop_label = catalog.get('propagation_methods', language)
+        if propagation := details.get('propagation_methods'):
+            propagation = translate(propagation, target_lang=language)
             extra_info.append(f"<b>{prop_label}</b>: {propagation}")
         else:
-            value = "Данные отсутствуют"
-            if language != 'ru':
-                prop_label = safe_translate(prop_label, target_lang=language)
-            value = safe_translate(value, target_lang=language)
-            extra_info.append(f"<b>{prop_label}</b>: {value}")
+            extra_info.append(f"<b>{prop_label}</b>: {catalog.get('no_data', language)}")
 
         if extra_info:
-            title = "#### ❓ Дополнительно"
-            if language != 'ru':
-                title = safe_translate(title, target_lang=language)
-            result.append(f"<b>{title}</b>")
+            result.append(f"<b>{catalog.get('extra_title', language)}</b>")
             result.extend(extra_info)
             result.append("")
 
         return "\n".join(result)
 
     except Exception as e:
-        error_msg = f"❌ Критическая ошибка форматирования данных: {str(e)}"
-        return safe_translate(error_msg, target_lang=language) if language != 'ru' else error_msg
+        return catalog.get('format_error', language, error=str(e))
+
+
+def get_similar_image_url(img: Dict[str, Any]) -> Optional[str]:
+    image_url = img.get("url_small") or img.get("url")
+    if not image_url:
+        print(f"[WARNING] URL изображения не найден в данных: {img}")
+        return None
+    if isinstance(image_url, list):
+        print(f"[WARNING] URL изображения — список, используем первый элемент: {image_url}")
+        image_url = image_url[0] if len(image_url) > 0 else None
+    elif not isinstance(image_url, str):
+        print(f"[WARNING] Некорректный тип URL изображения (не строка): {type(image_url)}")
+        return None
+    return image_url.strip() if image_url else None
 
 
 async def download_similar_images(
-        similar_images: List[Dict[str, Any]]
-) -> List[Tuple[bytes, Dict[str, Any]]]:
-    results = []
-    async with aiohttp.ClientSession() as session:
-        for img in similar_images:
-            image_url = img.get("url_small") or img.get("url")
-            if not image_url:
-                print(f"[WARNING] URL изображения не найден в данных: {img}")
-                continue
-            if isinstance(image_url, list):
-                print(f"[WARNING] URL изображения — список, используем первый элемент: {image_url}")
-                image_url = image_url[0] if len(image_url) > 0 else None
-            elif not isinstance(image_url, str):
-                print(f"[WARNING] Некорректный тип URL изображения (не строка): {type(image_url)}")
-                continue
-            if not image_url:
-                continue
-            print(image_url)
-            image_url = image_url.strip()
+        similar_images: List[Dict[str, Any]],
+        session: Optional[aiohttp.ClientSession] = None,
+        known_file_ids: Optional[Dict[str, str]] = None,
+        concurrency: int = 4,
+        image_timeout: float = 10.0,
+        total_timeout: float = 20.0
+) -> List[Tuple[Union[bytes, str], Dict[str, Any]]]:
+    """
+    Скачивает похожие изображения параллельно, не более concurrency за раз.
+
+    Для URL из known_file_ids вместо байтов возвращается сохранённый
+    Telegram file_id, и изображение не скачивается.
+
+    Каждое изображение ограничено image_timeout, вся загрузка — total_timeout;
+    по истечении общего срока возвращается то, что успело скачаться.
+    Порядок результатов совпадает с порядком similar_images.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession()
+
+    async def fetch(img: Dict[str, Any]) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        image_url = get_similar_image_url(img)
+        if not image_url:
+            return None
+        metadata = {
+            "similarity": img["similarity"],
+            "license_name": img.get("license_name"),
+            "license_url": img.get("license_url", "").strip() if img.get("license_url") else None,
+            "citation": img.get("citation"),
+            "source_url": image_url
+        }
+        if known_file_ids and image_url in known_file_ids:
+            return known_file_ids[image_url], metadata
+        async def request() -> bytes:
+            request_timeout = aiohttp.ClientTimeout(total=image_timeout)
+            async with session.get(image_url, timeout=request_timeout) as response:
+                response.raise_for_status()
+                return await response.read()
+
+        async with semaphore:
             try:
-                async with session.get(image_url) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        metadata = {
-                            "similarity": img["similarity"],
-                            "license_name": img.get("license_name"),
-                            "license_url": img.get("license_url", "").strip() if img.get("license_url") else None,
-                            "citation": img.get("citation"),
-                            "source_url": image_url
-                        }
-                        results.append((image_data, metadata))
-                        print(f"[INFO] Успешно загружено изображение: {image_url}")
-                    else:
-                        print(f"[ERROR] Ошибка загрузки изображения {image_url}: статус {response.status}")
+                image_data = await governor('images').call(request, operation='download')
+            except aiohttp.ClientResponseError as e:
+                print(f"[ERROR] Ошибка загрузки изображения {image_url}: статус {e.status}")
+                return None
             except Exception as e:
-                print(f"[ERROR] Исключение при загрузке изображения {image_url}: {str(e)}")
+                print(f"[ERROR] Исключение при загрузке изображения {image_url}: {e!r}")
+                return None
+        print(f"[INFO] Успешно загружено изображение: {image_url}")
+        return image_data, metadata
+
+    tasks = [asyncio.create_task(fetch(img)) for img in similar_images]
+    try:
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=total_timeout)
+            if pending:
+                print(f"[WARNING] Не уложились в {total_timeout} с, не загружено изображений: {len(pending)}")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        if own_session:
+            await session.close()
 
-    return results  # ← не забудь вернуть результат!
+    return [task.result() for task in tasks
+            if not task.cancelled() and task.exception() is None and task.result() is not None]
 
 
 def build_similar_images_media_group(
-        downloaded_images: List[Tuple[bytes, Dict[str, Any]]],
+        downloaded_images: List[Tuple[Union[bytes, str], Dict[str, Any]]],
         plant_name: str,
-        common_name: Optional[str] = None
+        common_name: Optional[str] = None,
+        language: str = 'ru'
 ) -> Optional[MediaGroupBuilder]:
     if not downloaded_images:
         return None
     media_group = MediaGroupBuilder(caption="")
-    plant_info = f"📸 <b>Похожие изображения:</b> {plant_name}"
+    plant_info = catalog.get('similar_images_title', language, name=plant_name)
     if common_name:
         plant_info += f" (<i>{common_name}</i>)"
     for i, (image_data, metadata) in enumerate(downloaded_images):
-        similarity = f"Сходство: {metadata['similarity'] * 100:.1f}%"
+        similarity = catalog.get('similarity', language, percent=metadata['similarity'] * 100)
         license_info = ""
         if metadata.get("license_name"):
-            license_info = f"\n\n<b>Лицензия:</b> {metadata['license_name']}"
+            license_info = f"\n\n<b>{catalog.get('license', language)}:</b> {metadata['license_name']}"
             if metadata.get("citation"):
-                license_info += f" (Автор: {metadata['citation']})"
+                license_info += f" ({catalog.get('author', language)}: {metadata['citation']})"
             if metadata.get("license_url"):
                 license_info += f"\n{metadata['license_url']}"
+        # Строка — это file_id уже загруженного в Telegram изображения
+        if isinstance(image_data, str):
+            media = image_data
+        else:
+            media = BufferedInputFile(image_data, filename=f"plant_{i}.jpg")
         if i == 0:
             caption = f"{plant_info}\n\n{similarity}{license_info}"
-            media_group.add_photo(
-                media=BufferedInputFile(image_data, filename=f"plant_{i}.jpg"),
-                caption=caption,
-                parse_mode="HTML"
-            )
         else:
             caption = f"{similarity}{license_info}"
-            media_group.add_photo(
-                media=BufferedInputFile(image_data, filename=f"plant_{i}.jpg"),
-                caption=caption,
-                parse_mode="HTML"
-            )
+        media_group.add_photo(
+            media=media,
+            caption=caption,
+            parse_mode="HTML"
+        )
     return media_group
 
 
 def parse_plant_health_response(
         json_data: Dict[str, Any],
         language: str = 'ru',
-        ai_treatment_response: Optional[str] = None
+        ai_treatment_response: Optional[str] = None,
+        translate: Callable[..., Any] = safe_translate
 ) -> str:
+    if translate is safe_translate and language != 'ru':
+        translate = prefetch_translations(parse_plant_health_response, json_data, language, ai_treatment_response,
+                                          target_lang=language)
     try:
         result_data = json_data.get('result', {})
         is_plant = result_data.get('is_plant', {}).get('binary', False)
         plant_probability = result_data.get('is_plant', {}).get('probability', 0)
 
         if not is_plant:
-            msg = f"Анализ показывает, что предоставленное изображение, скорее всего, НЕ содержит растение (вероятность: {1 - plant_probability:.2%})."
-            return safe_translate(msg, target_lang=language) if language != 'ru' else msg
+            return catalog.get('health_not_plant', language, probability=1 - plant_probability)
 
         is_healthy = result_data.get('is_healthy', {}).get('binary', True)
         health_probability = result_data.get('is_healthy', {}).get('probability', 1.0)
 
-        result_lines = []
-
-        title = "### 🌿 Состояние здоровья растения"
-        if language != 'ru':
-            title = safe_translate(title, target_lang=language)
-        result_lines.append(f"<b>{title}</b>\n")
+        result_lines = [f"<b>{catalog.get('health_title', language)}</b>\n"]
 
         if is_healthy:
-            health_msg = f"Растение выглядит здоровым (вероятность здоровья: {health_probability:.2%})."
-            if language != 'ru':
-                health_msg = safe_translate(health_msg, target_lang=language)
+            health_msg = catalog.get('health_healthy', language, probability=health_probability)
             result_lines.append(f"✅ <b>{health_msg}</b>\n")
             return "\n".join(result_lines)
         else:
-            health_msg = f"Растение, вероятно, имеет проблемы со здоровьем (вероятность здоровья: всего {health_probability:.2%})."
-            if language != 'ru':
-                health_msg = safe_translate(health_msg, target_lang=language)
+            health_msg = catalog.get('health_unhealthy', language, probability=health_probability)
             result_lines.append(f"⚠️ <b>{health_msg}</b>\n")
 
-        disease_section = "#### 🩺 Возможные проблемы"
-        if language != 'ru':
-            disease_section = safe_translate(disease_section, target_lang=language)
-        result_lines.append(f"<b>{disease_section}</b>")
+        result_lines.append(f"<b>{catalog.get('health_problems_title', language)}</b>")
 
         suggestions = result_data.get('disease', {}).get('suggestions', [])
         if not suggestions:
-            no_issues_msg = "Не удалось определить конкретные проблемы. Пожалуйста, проверьте изображение и повторите запрос."
-            if language != 'ru':
-                no_issues_msg = safe_translate(no_issues_msg, target_lang=language)
-            result_lines.append(f"— {no_issues_msg}")
+            result_lines.append(f"— {catalog.get('health_no_issues', language)}")
         else:
             for i, suggestion in enumerate(suggestions[:3], 1):
-                name = suggestion.get('name', 'Неизвестная проблема')
+                name = suggestion.get('name', catalog.get('health_unknown_problem', language))
                 probability = suggestion.get('probability', 0)
 
-                translated_name = safe_translate(name, target_lang=language) if language != 'ru' else name
+                translated_name = translate(name, target_lang=language) if language != 'ru' else name
                 problem_line = f"{i}. {translated_name.capitalize()} — <b>{probability:.2%}</b>"
                 result_lines.append(f"— {problem_line}")
 
@@ -405,13 +611,10 @@ def parse_plant_health_response(
         if question_data:
             question_text = question_data.get('text', '')
             if question_text:
-                diag_section = "#### ❓ Диагностический вопрос"
-                if language != 'ru':
-                    diag_section = safe_translate(diag_section, target_lang=language)
-                result_lines.append(f"\n<b>{diag_section}</b>")
+                result_lines.append(f"\n<b>{catalog.get('health_question_title', language)}</b>")
 
-                translated_question = safe_translate(question_text,
-                                                     target_lang=language) if language != 'ru' else question_text
+                translated_question = translate(question_text,
+                                                target_lang=language) if language != 'ru' else question_text
                 result_lines.append(f"— {translated_question}")
 
                 options = question_data.get('options', {})
@@ -421,38 +624,30 @@ def parse_plant_health_response(
                     yes_index = yes_opt.get('suggestion_index', 0)
                     no_index = no_opt.get('suggestion_index', 0)
 
-                    yes_problem = suggestions[yes_index]['name'] if yes_index < len(suggestions) else "проблема"
-                    no_problem = suggestions[no_index]['name'] if no_index < len(suggestions) else "проблема"
-
-                    yes_problem_trans = safe_translate(yes_problem,
-                                                       target_lang=language) if language != 'ru' else yes_problem
-                    no_problem_trans = safe_translate(no_problem,
-                                                      target_lang=language) if language != 'ru' else no_problem
+                    problem = catalog.get('health_problem', language)
+                    yes_problem = suggestions[yes_index]['name'] if yes_index < len(suggestions) else problem
+                    no_problem = suggestions[no_index]['name'] if no_index < len(suggestions) else problem
 
-                    yes_label = "Да" if language == 'ru' else safe_translate("Yes", target_lang=language)
-                    no_label = "Нет" if language == 'ru' else safe_translate("No", target_lang=language)
+                    yes_problem_trans = translate(yes_problem,
+                                                  target_lang=language) if language != 'ru' else yes_problem
+                    no_problem_trans = translate(no_problem,
+                                                 target_lang=language) if language != 'ru' else no_problem
 
-                    result_lines.append(f"   • {yes_label}: <i>{yes_problem_trans}</i>")
-                    result_lines.append(f"   • {no_label}: <i>{no_problem_trans}</i>")
+                    result_lines.append(f"   • {catalog.get('yes', language)}: <i>{yes_problem_trans}</i>")
+                    result_lines.append(f"   • {catalog.get('no', language)}: <i>{no_problem_trans}</i>")
 
         if ai_treatment_response:
-            treatment_section = "#### 💊 Рекомендации по лечению"
-            if language != 'ru':
-                treatment_section = safe_translate(treatment_section, target_lang=language)
-            result_lines.append(f"\n<b>{treatment_section}</b>")
+            result_lines.append(f"\n<b>{catalog.get('health_treatment_title', language)}</b>")
             result_lines.append(ai_treatment_response.strip())
 
-        license_note = "ℹ️ Примечание: Изображения для сравнения лицензированы под CC BY-NC-SA 4.0 (разрешено некоммерческое использование с указанием авторства и обязательным распространением производных работ на тех же условиях)."
-        if language != 'ru':
-            license_note = safe_translate(license_note, target_lang=language)
-        result_lines.append(f"\n{license_note}")
+        result_lines.append(f"\n{catalog.get('health_license_note', language)}")
 
         return "\n".join(result_lines)
 
     except Exception as e:
-        error_msg = f"❌ Критическая ошибка форматирования данных: {str(e)}"
+        error_msg = catalog.get('format_error', language, error=str(e))
         print(error_msg)
-        raise Exception(safe_translate(error_msg, target_lang=language) if language != 'ru' else error_msg) from e
+        raise Exception(error_msg) from e
 
 
 def split_text(text: str, max_length: int = 4096) -> list[str]:
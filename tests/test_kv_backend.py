@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Awaitable, Callable
+
+import src.repository.kv.standin as standin
+from src.repository.kv.backend import KeyValueRepository
+from src.repository.kv.client import KVClient
+from src.repository.kv.standin import StandInServer
+from src.repository.session import UserSession
+
+
+def run_with_server(test: Callable[[KeyValueRepository, StandInServer], Awaitable[None]]):
+    """Поднимает заглушку на свободном порту и прогоняет тест против настоящего клиента."""
+    async def main():
+        server = StandInServer()
+        listener = await server.start('127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        repository = KeyValueRepository(f'redis://127.0.0.1:{port}/0', prefix='test:', pool_size=2, timeout=2.0)
+        try:
+            await test(repository, server)
+        finally:
+            await repository.stop()
+            listener.close()
+            await listener.wait_closed()
+
+    asyncio.run(main())
+
+
+def test_session_round_trip():
+    async def test(repository: KeyValueRepository, server: StandInServer):
+        assert await repository.get_user_session(1) == UserSession(1)
+        session = UserSession(1, 'ru', 'token', 'hash', 'Rosa', 37.6, 55.7)
+        await repository.save_user_session(session)
+        assert await repository.get_user_session(1) == session
+        assert await repository.get_user_session(2) == UserSession(2)
+
+    run_with_server(test)
+
+
+def test_photo_index():
+    async def test(repository: KeyValueRepository, server: StandInServer):
+        assert await repository.get_photo_by_hash('hash', 'ru') is None
+        await repository.save_photo('hash', 'ru', 'unique', 'file', 'result', 'token', 'Rosa')
+        assert await repository.get_photo_by_hash('hash', 'ru') == ('result', 'token', 'Rosa')
+        assert await repository.get_photo_by_hash('hash', 'en') is None
+        assert await repository.get_photo_by_file_id('unique', 'ru') == ('hash', 'result', 'token', 'Rosa')
+        assert await repository.get_photo_file_id('token') == 'file'
+
+        await repository.set_photo_file_id('hash', 'ru', 'unique2', 'file2')
+        assert await repository.get_photo_by_file_id('unique2', 'ru') == ('hash', 'result', 'token', 'Rosa')
+        assert await repository.get_photo_file_id('token') == 'file2'
+
+        assert await repository.get_photo_health('token', 'ru') is None
+        await repository.set_photo_health('token', 'ru', 'healthy')
+        assert await repository.get_photo_health('token', 'ru') == 'healthy'
+
+    run_with_server(test)
+
+
+def test_image_file_ids():
+    async def test(repository: KeyValueRepository, server: StandInServer):
+        assert await repository.get_image_file_ids([]) == {}
+        await repository.set_image_file_ids({'a': '1', 'b': '2'})
+        assert await repository.get_image_file_ids(['a', 'b', 'c']) == {'a': '1', 'b': '2'}
+        await repository.delete_image_file_ids(['a'])
+        assert await repository.get_image_file_ids(['a', 'b']) == {'b': '2'}
+
+    run_with_server(test)
+
+
+def test_set_with_ttl_expires(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    # Заглушка считает срок жизни по time.monotonic, подменяем только её часы
+    monkeypatch.setattr(standin, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+
+    async def test(repository: KeyValueRepository, server: StandInServer):
+        client: KVClient = repository.client
+        await client.set('short', 'value', ttl=10)
+        await client.set('forever', 'value')
+        assert await client.get('short') == b'value'
+        clock.now += 11
+        assert await client.get('short') is None
+        assert await client.mget(['short', 'forever']) == [None, b'value']
+
+    run_with_server(test)
+
+
+def test_history_pagination():
+    async def test(repository: KeyValueRepository, server: StandInServer):
+        assert await repository.get_identifications(1) == []
+        for i in range(1, 8):
+            await repository.add_identification(1, f'token{i}', f'flower{i}', i / 10, 'ru', None, None,
+                                                f'hash{i}', f'result{i}')
+        await repository.add_identification(2, 'other', 'other', 0.5, 'en', None, None, None, 'other')
+
+        first = await repository.get_identifications(1, limit=3)
+        assert [(row[0], row[1], row[2]) for row in first] == [(7, 'flower7', 0.7), (6, 'flower6', 0.6),
+                                                                (5, 'flower5', 0.5)]
+        second = await repository.get_identifications(1, before_id=first[-1][0], limit=3)
+        assert [row[0] for row in second] == [4, 3, 2]
+        last = await repository.get_identifications(1, before_id=second[-1][0], limit=3)
+        assert [row[0] for row in last] == [1]
+        assert await repository.get_identifications(1, before_id=1, limit=3) == []
+
+        assert await repository.get_identification(1, 3) == ('token3', 'flower3', 'ru', 'hash3', 'result3')
+        assert await repository.get_identification(1, 8) is None
+        assert await repository.get_identification(2, 1) == ('other', 'other', 'en', None, 'other')
+
+    run_with_server(test)
+
+
+def test_copy_identification():
+    async def test(repository: KeyValueRepository, server: StandInServer):
+        await repository.add_identification(1, 'token', 'Rosa', 0.9, 'ru', None, None, 'hash', 'result')
+        await repository.copy_identification(2, 'token', 37.6, 55.7, None)
+        await repository.copy_identification(2, 'unknown', None, None, None)
+
+        history = await repository.get_identifications(2)
+        assert [(row[0], row[1], row[2]) for row in history] == [(1, 'Rosa', 0.9)]
+        assert await repository.get_identification(2, 1) == ('token', 'Rosa', 'ru', 'hash', 'result')
+
+    run_with_server(test)